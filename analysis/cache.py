@@ -0,0 +1,191 @@
+"""A persistent cache of check results, keyed by chorale content.
+
+An entry is stored under the SHA-256 of the rule-set version and the pitch
+codes of the chorale, so a chorale is found again whatever file or line it
+came from, and every entry is invalidated at once when the sources of the
+checkers change. Entries are small JSON files in a two-level directory tree.
+
+Several processes may share a cache directory. An entry is written to a
+temporary file and renamed into place, so readers see a whole entry or none,
+and a process that finds an entry missing or unreadable just checks again.
+Every hit touches its entry, and once a process has written a tenth of the
+size limit it evicts the least recently used entries until the cache is back
+under the limit.
+
+    >>> import tempfile
+    >>> from analysis.chorale import Chorale
+    >>> directory = tempfile.TemporaryDirectory()
+    >>> cache = ResultCache(directory.name)
+    >>> chorale = Chorale.from_strings(['C5'], ['E4'], ['G3'], ['C3'])
+    >>> cache.get(chorale) is None
+    True
+    >>> cache.put(chorale, {"violations": []})
+    >>> cache.get(Chorale.from_strings(['B#4'], ['E4'], ['G3'], ['C3'])) is None
+    True
+    >>> cache.get(chorale)
+    {'violations': []}
+    >>> import utils
+    >>> other = Chorale.from_strings(['D5'], ['F#4'], ['A3'], ['D3'])
+    >>> utils.chorale_results(other, cache) == cache.get(other)
+    True
+    >>> cache.get(other, key_window=8) is None
+    True
+    >>> directory.cleanup()
+"""
+import hashlib
+import json
+import os
+import sys
+import tempfile
+
+from .chorale import Chorale
+
+# the modules whose sources decide the results of the checks, and utils.py, which builds
+# the cached results in chorale_results
+RULE_PACKAGES = ["voice_leading", "harmony"]
+RULE_MODULES = ["analysis/chorale.py", "analysis/context.py", "analysis/keys.py", "utils.py"]
+
+DEFAULT_MAX_BYTES = 256 << 20
+
+_rules_version = None
+
+
+def rules_version():
+    """Returns a hash of the sources of the checkers, computed once per process
+    """
+    global _rules_version
+    if _rules_version is None:
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        paths = list(RULE_MODULES)
+        for package in RULE_PACKAGES:
+            paths += sorted(os.path.join(package, name) for name in os.listdir(os.path.join(root, package))
+                            if name.endswith(".py"))
+        digest = hashlib.sha256()
+        for path in paths:
+            digest.update(path.encode("utf-8"))
+            with open(os.path.join(root, path), "rb") as f:
+                digest.update(f.read())
+        _rules_version = digest.hexdigest()[:16]
+    return _rules_version
+
+
+def content_key(chorale, key_window=None):
+    """Returns the hex digest identifying a compact Chorale or a music21 score under the current rules
+    and the key window the checks were run with, as utils.chorale_results takes it
+    """
+    if not isinstance(chorale, Chorale):
+        chorale = Chorale.from_score(chorale)
+    digest = hashlib.sha256(rules_version().encode("ascii"))
+    digest.update(json.dumps([key_window]).encode("utf-8"))
+    for voice in chorale.midi + chorale.steps:
+        if sys.byteorder == "big":
+            voice = voice[:]
+            voice.byteswap()
+        digest.update(len(voice).to_bytes(4, "little"))
+        digest.update(voice.tobytes())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.written = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __getstate__(self):
+        # worker processes start their own counts
+        return {"directory": self.directory, "max_bytes": self.max_bytes}
+
+    def __setstate__(self, state):
+        self.__init__(state["directory"], state["max_bytes"])
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key[2:] + ".json")
+
+    def get(self, chorale, key_window=None):
+        """Returns the result stored for the chorale checked with a key window, or None
+        """
+        return self.get_key(content_key(chorale, key_window))
+
+    def put(self, chorale, result, key_window=None):
+        """Stores the JSON serializable result of the chorale checked with a key window
+        """
+        self.put_key(content_key(chorale, key_window), result)
+
+    def get_key(self, key):
+        path = self.path(key)
+        try:
+            with open(path) as f:
+                result = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return result
+
+    def put_key(self, key, result):
+        path = self.path(key)
+        data = json.dumps(result, separators=(",", ":")).encode("utf-8")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temporary = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(temporary, path)
+        except OSError:
+            try:
+                os.remove(temporary)
+            except OSError:
+                pass
+            return
+        self.written += len(data)
+        if self.written > self.max_bytes // 10:
+            self.written = 0
+            self.evict()
+
+    def entries(self):
+        """Returns (last use, size, path) of every entry, least recently used first
+        """
+        result = []
+        if not os.path.isdir(self.directory):
+            return result
+        for shard in os.scandir(self.directory):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith(".json"):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    result.append((stat.st_mtime, stat.st_size, entry.path))
+        return sorted(result)
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self, target=None):
+        """Removes the least recently used entries until the cache holds at most target bytes,
+        by default nine tenths of max_bytes. Returns the number of entries removed.
+        """
+        if target is None:
+            target = self.max_bytes * 9 // 10
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                pass  # removed by another process
+            total -= size
+        return removed
+
+    def clear(self):
+        return self.evict(0)
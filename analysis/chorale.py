@@ -0,0 +1,110 @@
+"""A compact chorale representation.
+
+A Chorale stores every voice as two arrays of small integers, the MIDI numbers
+and the diatonic steps of its notes, instead of a music21 stream of Note
+objects. The rules run on it directly, and it is converted to a music21 score
+only when an API asks for one.
+"""
+from array import array
+
+from voice_leading import pitches
+
+VOICE_IDS = ["bass", "tenor", "alto", "soprano"]
+
+
+class Voice(list):
+    """A list of the (midi, step) codes of a voice, carrying the voice id like a music21 part.
+    The rules of voice_leading.error_checks accept it in place of a part.
+    """
+    def __init__(self, codes, voice_id):
+        list.__init__(self, codes)
+        self.id = voice_id
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return Voice(list.__getitem__(self, index), self.id)
+        return list.__getitem__(self, index)
+
+
+class Chorale:
+    """Four voices of equal length stored as arrays of pitch codes, from the bass up.
+
+    >>> chorale = Chorale.from_strings(['C5', 'D5'], ['E4', 'F4'], ['G3', 'A3'], ['C3', 'D3'])
+    >>> len(chorale)
+    2
+    >>> chorale.slices()[1]
+    ((50, 23), (57, 27), (65, 32), (74, 37))
+    >>> chorale.names("soprano")
+    ['C5', 'D5']
+    """
+    __slots__ = ("midi", "steps", "_score")
+
+    def __init__(self, midi, steps):
+        """midi and steps are sequences of four integer sequences ordered from the bass up
+        """
+        assert len(midi) == len(steps) == len(VOICE_IDS), "A chorale has four voices"
+        assert len(set(map(len, midi))) == 1 and list(map(len, midi)) == list(map(len, steps)), \
+            "Voices must have same length"
+        self.midi = [array("h", voice) for voice in midi]
+        self.steps = [array("h", voice) for voice in steps]
+        self._score = None
+
+    @classmethod
+    def from_codes(cls, voices):
+        """Builds a chorale from four lists of (midi, step) codes ordered from the bass up
+        """
+        return cls([[code[0] for code in voice] for voice in voices],
+                   [[code[1] for code in voice] for voice in voices])
+
+    @classmethod
+    def from_strings(cls, soprano, alto, tenor, bass):
+        """Builds a chorale from four lists of note names, like utils.make_chorale_from_strings
+        """
+        assert len(soprano) == len(alto) == len(tenor) == len(bass), "Voices must have same length"
+        return cls.from_codes([[pitches.parse_name(name) for name in voice]
+                               for voice in [bass, tenor, alto, soprano]])
+
+    @classmethod
+    def from_score(cls, score):
+        """Encodes a music21 score with parts named soprano, alto, tenor and bass
+        """
+        encoded = [pitches.encode_voice(score.getElementById(voice_id)) for voice_id in VOICE_IDS]
+        chorale = cls([midi for midi, _ in encoded], [steps for _, steps in encoded])
+        chorale._score = score
+        return chorale
+
+    def __len__(self):
+        return len(self.midi[0])
+
+    def voice(self, voice_id):
+        """Returns the (midi, step) codes of a voice as a Voice
+        """
+        v = VOICE_IDS.index(voice_id)
+        return Voice(zip(self.midi[v], self.steps[v]), voice_id)
+
+    def slices(self):
+        """Returns the (midi, step) codes of every vertical slice, ordered from the bass up
+        """
+        return list(zip(*(zip(midi, steps) for midi, steps in zip(self.midi, self.steps))))
+
+    def names(self, voice_id):
+        """Returns the music21 note names with octave of a voice
+        """
+        return [pitches.code_name(code) for code in self.voice(voice_id)]
+
+    def to_score(self):
+        """Returns the chorale as a music21 score, built on first use
+        """
+        if self._score is None:
+            from music21 import note, stream
+            parts = []
+            for voice_id in reversed(VOICE_IDS):
+                part = stream.Part()
+                part.id = voice_id
+                for i, name in enumerate(self.names(voice_id)):
+                    n = note.Note(name)
+                    n.offset = i
+                    part.append(n)
+                parts.append(part)
+            self._score = stream.Score(parts)
+        return self._score
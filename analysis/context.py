@@ -0,0 +1,175 @@
+"""Shared per-chorale analysis.
+
+Key analysis and chordify are the most expensive calls made on a chorale, and
+several checkers need them. An AnalysisContext computes each of them lazily,
+at most once, and every checker accepts a context wherever it accepts a chorale.
+
+A context can also wrap a compact analysis.chorale.Chorale. Its slices, key and
+chords are then computed from the pitch codes, and the music21 score is only
+built if a music21 based check asks for the voices.
+"""
+from .chorale import Chorale, Voice
+
+VOICE_IDS = ["bass", "tenor", "alto", "soprano"]
+
+
+class AnalysisContext:
+    def __init__(self, chorale, chorale_key=None, key_window=None):
+        """chorale is a music21 score with parts named soprano, alto, tenor and bass,
+        or a compact Chorale.
+        chorale_key is an optional music21 key object to use instead of analyzing the chorale.
+        key_window is an optional number of slices: each slice then gets the key of the window
+        centered on it, for chorales that modulate, unless chorale_key is given.
+        """
+        if isinstance(chorale, Chorale):
+            self.compact, self._chorale = chorale, None
+        else:
+            self.compact, self._chorale = None, chorale
+        self._key = chorale_key
+        self._estimated_key = None
+        self.key_window = key_window if chorale_key is None else None
+        self._local_keys = None
+        self._voices = None
+        self._code_voices = None
+        self._chords = None
+        self._slices = None
+
+    @property
+    def chorale(self):
+        """The music21 score of the chorale, built from the compact chorale on first use
+        """
+        if self._chorale is None:
+            self._chorale = self.compact.to_score()
+        return self._chorale
+
+    @property
+    def key(self):
+        """The key of the chorale, analyzed on first use
+        """
+        if self._key is None:
+            if self.compact is not None:
+                from . import keys
+                self._key = keys.to_music21(self.estimated_key)
+            else:
+                self._key = analyze_key(self.chorale)
+        return self._key
+
+    @property
+    def estimated_key(self):
+        """The (tonic name, mode) of the key of a compact chorale, estimated on first use without music21
+        """
+        if self._estimated_key is None:
+            from . import keys
+            estimator = keys.KeyEstimator()
+            for codes in self.slices:
+                estimator.add(codes)
+            self._estimated_key = estimator.estimate()
+        return self._estimated_key
+
+    @property
+    def leading_tone(self):
+        """The (midi, step) code of the leading tone of the key. For a compact chorale
+        without a given key it is found without music21.
+        """
+        from voice_leading import pitches
+        if self._key is None and self.compact is not None:
+            from . import keys
+            return keys.leading_tone(self.estimated_key)
+        return pitches.encode_pitch(self.key.getLeadingTone())
+
+    @property
+    def local_keys(self):
+        """The (tonic name, mode) of the key of every slice when a key window is set, else None
+        """
+        if self._local_keys is None and self.key_window:
+            from . import keys
+            self._local_keys = keys.window_keys(self.slices, self.key_window)
+        return self._local_keys
+
+    @property
+    def leading_tones(self):
+        """The code of the leading tone of the chorale key, or the list of the codes of the
+        leading tones of every slice when a key window is set
+        """
+        if self.local_keys is None:
+            return self.leading_tone
+        from . import keys
+        codes = {estimated: keys.leading_tone(estimated) for estimated in set(self.local_keys)}
+        return [codes[estimated] for estimated in self.local_keys]
+
+    @property
+    def chord_keys(self):
+        """The music21 key of the chorale, or the list of the music21 keys of every chord
+        when a key window is set
+        """
+        if self.local_keys is None:
+            return self.key
+        from . import keys
+        return [keys.to_music21(estimated) for estimated in self.local_keys]
+
+    @property
+    def voices(self):
+        """The parts of the chorale from the bass up
+        """
+        if self._voices is None:
+            self._voices = [self.chorale.getElementById(voice_id) for voice_id in VOICE_IDS]
+        return self._voices
+
+    @property
+    def code_voices(self):
+        """The voices from the bass up as Voice lists of (midi, step) codes
+        """
+        if self._code_voices is None:
+            self._code_voices = [Voice(voice, voice_id) for voice, voice_id in zip(zip(*self.slices), VOICE_IDS)]
+        return self._code_voices
+
+    @property
+    def chords(self):
+        """The chords of the chordified chorale, chordified on first use
+        """
+        if self._chords is None and self.compact is not None:
+            from harmony.helpers import chord_from_codes
+            self._chords = [chord_from_codes(codes) for codes in self.slices]
+        elif self._chords is None:
+            self._chords = chordify(self.chorale)
+        return self._chords
+
+    @property
+    def slices(self):
+        """The (midi, step) codes of every vertical slice, encoded on first use
+        """
+        if self._slices is None and self.compact is not None:
+            self._slices = self.compact.slices()
+        elif self._slices is None:
+            from voice_leading import pipeline
+            self._slices = pipeline.get_slices(self.voices)
+        return self._slices
+
+
+def analyze_key(chorale):
+    """Returns the key music21 finds for a score
+    """
+    return chorale.analyze("key")
+
+
+def chordify(chorale):
+    """Returns the chords of a chordified score
+    """
+    from music21 import chord
+    return [c for c in chorale.chordify().recurse() if type(c) is chord.Chord]
+
+
+def get_context(chorale):
+    """Returns chorale if it is already an AnalysisContext, and a new context of the chorale,
+    a music21 score or a compact Chorale, otherwise.
+
+    >>> import utils
+    >>> context = get_context(utils.make_chorale_from_strings(['C5'], ['E4'], ['G3'], ['C3']))
+    >>> get_context(context) is context
+    True
+    >>> context.slices
+    [((48, 22), (55, 26), (64, 31), (72, 36))]
+    """
+    if isinstance(chorale, AnalysisContext):
+        return chorale
+    return AnalysisContext(chorale)
@@ -0,0 +1,299 @@
+"""Binary corpus files of chorales ingested from MusicXML, MIDI or the music21 corpus.
+
+Parsing a score with music21 takes far longer than checking it, so a corpus is
+ingested once into a file of packed arrays and later runs load the arrays
+directly:
+
+    python -m analysis.corpus bach.jcb corpus:bach
+    python -m analysis.corpus mine.jcb scores/*.mxl midi/*.mid
+    python batch.py bach.jcb
+
+Ingestion finds the soprano, alto, tenor and bass parts of a score by name,
+or takes the parts of a four-part score from the top down, and slices the
+voices at every note onset, keeping the slices where all four voices sound.
+
+A corpus file starts with MAGIC and holds one record per chorale, all numbers
+little-endian: the number of slices and the length of the metadata as two
+uint32, the metadata as UTF-8 JSON, then the MIDI numbers and the diatonic
+steps of each voice from the bass up as int16 and the offset of each slice in
+TICKS per quarter note as int32.
+
+    >>> import io
+    >>> from analysis.chorale import Chorale
+    >>> chorale = Chorale.from_strings(['C5', 'D5'], ['E4', 'F4'], ['G3', 'A3'], ['C3', 'D3'])
+    >>> f = io.BytesIO()
+    >>> write_corpus(f, [CorpusEntry(chorale, [0, 960], {"title": "test"})])
+    1
+    >>> entry = next(read_entries(f.getvalue()))
+    >>> entry.chorale.slices() == chorale.slices(), list(entry.offsets), entry.metadata["title"]
+    (True, [0, 960], 'test')
+"""
+import argparse
+import glob
+import json
+import mmap
+import struct
+import sys
+from array import array
+from bisect import bisect_right
+from collections import namedtuple
+
+from voice_leading import pitches
+
+from .chorale import Chorale, VOICE_IDS
+from .reader import ChoraleRecord
+
+MAGIC = b"JOHANNC1"
+HEADER = struct.Struct("<II")
+TICKS = 480
+
+CorpusEntry = namedtuple("CorpusEntry", ["chorale", "offsets", "metadata"])
+CorpusEntry.__doc__ = """A chorale, the offset in ticks of each of its slices and its metadata dict"""
+
+# lower case part names and abbreviations of each voice
+PART_NAMES = {"soprano": ["soprano", "sopran", "s", "cantus"],
+              "alto": ["alto", "alt", "a", "altus"],
+              "tenor": ["tenor", "t", "tenore"],
+              "bass": ["bass", "basso", "b", "bassus"]}
+
+
+class CorpusFormatError(ValueError):
+    def __init__(self, filename, position, reason):
+        self.filename = filename
+        self.position = position
+        self.reason = reason
+        self.message = "%s: byte %d: %s" % (filename, position, reason)
+        ValueError.__init__(self, self.message)
+
+    def __reduce__(self):
+        return CorpusFormatError, (self.filename, self.position, self.reason)
+
+
+def little_endian(values):
+    """Returns an array in little-endian byte order, byte swapping a copy on big-endian machines
+    """
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values
+
+
+def pack_entry(entry):
+    """Returns the bytes of the record of a CorpusEntry
+    """
+    chorale = entry.chorale
+    metadata = json.dumps(entry.metadata, sort_keys=True).encode("utf-8")
+    data = [HEADER.pack(len(chorale), len(metadata)), metadata]
+    for voice in chorale.midi + chorale.steps:
+        data.append(little_endian(voice).tobytes())
+    data.append(little_endian(array("i", entry.offsets)).tobytes())
+    return b"".join(data)
+
+
+def write_corpus(f, entries):
+    """Writes a corpus of CorpusEntry records to a binary file object and returns their number
+    """
+    f.write(MAGIC)
+    count = 0
+    for entry in entries:
+        f.write(pack_entry(entry))
+        count += 1
+    return count
+
+
+def unpack_array(typecode, data, start, count):
+    values = array(typecode)
+    values.frombytes(data[start:start + count * values.itemsize])
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values, start + count * values.itemsize
+
+
+def read_entries(data, filename="<bytes>"):
+    """Yields the CorpusEntry of every record of the bytes or memory map of a corpus file.
+    Raises a CorpusFormatError at the first malformed record.
+    """
+    if data[:len(MAGIC)] != MAGIC:
+        raise CorpusFormatError(filename, 0, "not a chorale corpus file")
+    position = len(MAGIC)
+    while position < len(data):
+        start = position
+        if position + HEADER.size > len(data):
+            raise CorpusFormatError(filename, start, "truncated record header")
+        length, metadata_length = HEADER.unpack_from(data, position)
+        position += HEADER.size
+        end = position + metadata_length + 2 * 8 * length + 4 * length
+        if end > len(data):
+            raise CorpusFormatError(filename, start, "truncated record of %d slices" % length)
+
+        try:
+            metadata = json.loads(bytes(data[position:position + metadata_length]).decode("utf-8"))
+        except ValueError as e:
+            raise CorpusFormatError(filename, start, "invalid metadata: %s" % e)
+        position += metadata_length
+        voices = []
+        for _ in range(2 * len(VOICE_IDS)):
+            voice, position = unpack_array("h", data, position, length)
+            voices.append(voice)
+        offsets, position = unpack_array("i", data, position, length)
+        yield CorpusEntry(Chorale(voices[:4], voices[4:]), offsets, metadata)
+
+
+def read_corpus(filename):
+    """Yields the CorpusEntry of every chorale of a corpus file, read through a memory map
+    """
+    with open(filename, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+        for entry in read_entries(m, filename):
+            yield entry
+
+
+def read_file(filename):
+    """Yields a ChoraleRecord for every chorale of a corpus file, numbered from 1 in place of a line.
+    A malformed file gives a record with its CorpusFormatError after the chorales read before it.
+    """
+    number = 0
+    try:
+        for entry in read_corpus(filename):
+            number += 1
+            yield ChoraleRecord(filename, number, entry.chorale, None)
+    except (CorpusFormatError, ValueError) as e:
+        yield ChoraleRecord(filename, number + 1, None, e)
+
+
+def part_names(part):
+    """Returns the lower case id, name and abbreviation of a music21 part
+    """
+    names = [part.id, part.partName, part.partAbbreviation]
+    return [str(name).strip().rstrip(".").lower() for name in names if isinstance(name, str)]
+
+
+def find_voices(score):
+    """Returns {voice id: part} of the soprano, alto, tenor and bass of a music21 score.
+    Parts are matched by name, or taken from the top down in a score of four parts.
+    """
+    parts = list(score.parts)
+    voices = {}
+    for voice_id, names in PART_NAMES.items():
+        for part in parts:
+            if any(name in names for name in part_names(part)) and part not in voices.values():
+                voices[voice_id] = part
+                break
+    if len(voices) == len(VOICE_IDS):
+        return voices
+    if len(parts) == len(VOICE_IDS):
+        return dict(zip(["soprano", "alto", "tenor", "bass"], parts))
+    raise ValueError("no soprano, alto, tenor and bass among the parts %s"
+                     % [(part_names(part) or ["?"])[0] for part in parts])
+
+
+def sounding_notes(part):
+    """Returns the (onset, end, code) of every note of a part in ticks, with tied notes merged.
+    The highest pitch of a chord is taken.
+    """
+    result = []
+    for n in part.flatten().notes:
+        onset = round(float(n.offset) * TICKS)
+        end = onset + round(float(n.quarterLength) * TICKS)
+        if n.tie is not None and n.tie.type in ("stop", "continue") and result and result[-1][1] == onset:
+            result[-1] = (result[-1][0], end, result[-1][2])
+            continue
+        pitch = max(n.pitches, key=lambda p: p.ps)
+        result.append((onset, end, pitches.encode_pitch(pitch)))
+    return result
+
+
+def ingest_score(score, metadata=None):
+    """Returns the CorpusEntry of a music21 score, sliced at every onset where all four voices sound
+    """
+    voices = find_voices(score)
+    notes = [sounding_notes(voices[voice_id]) for voice_id in VOICE_IDS]
+    onsets = sorted({onset for voice in notes for onset, _, _ in voice})
+
+    codes = [[] for _ in VOICE_IDS]
+    offsets = []
+    for offset in onsets:
+        slice_codes = []
+        for voice in notes:
+            i = bisect_right(voice, (offset, float("inf"))) - 1
+            if i < 0 or voice[i][1] <= offset:
+                break
+            slice_codes.append(voice[i][2])
+        else:
+            for voice, code in zip(codes, slice_codes):
+                voice.append(code)
+            offsets.append(offset)
+
+    metadata = dict(metadata or {})
+    metadata["parts"] = {voice_id: (part_names(part) or [None])[0] for voice_id, part in voices.items()}
+    if score.metadata is not None and score.metadata.title:
+        metadata.setdefault("title", score.metadata.title)
+    return CorpusEntry(Chorale.from_codes(codes), offsets, metadata)
+
+
+def expand_sources(sources):
+    """Expands glob patterns, and "corpus:bach" style composer names of the music21 corpus,
+    into a list of sources
+    """
+    result = []
+    for source in sources:
+        if source.startswith("corpus:") and "/" not in source:
+            from music21 import corpus
+            # roman numeral analyses share the directories of the scores
+            result += ["corpus:" + str(path) for path in corpus.getComposer(source[len("corpus:"):])
+                       if not str(path).endswith(".rntxt")]
+        elif not source.startswith("corpus:") and glob.has_magic(source):
+            result += sorted(glob.glob(source, recursive=True))
+        else:
+            result.append(source)
+    return result
+
+
+def parse_source(source):
+    """Returns the music21 scores of a file, or of a "corpus:" name or path of the music21 corpus
+    """
+    from music21 import converter, corpus, stream
+    if source.startswith("corpus:"):
+        parsed = corpus.parse(source[len("corpus:"):])
+    else:
+        parsed = converter.parse(source)
+    if isinstance(parsed, stream.Opus):
+        return list(parsed.scores)
+    return [parsed]
+
+
+def ingest(sources, log=None):
+    """Yields the CorpusEntry of every chorale of the sources. Scores that cannot be parsed
+    or have no four voices are reported to log, if given, and skipped.
+    """
+    for source in expand_sources(sources):
+        try:
+            scores = parse_source(source)
+        except Exception as e:
+            if log:
+                log("%s: %s: %s" % (source, type(e).__name__, e))
+            continue
+        for number, score in enumerate(scores, 1):
+            try:
+                yield ingest_score(score, {"source": source, "number": number})
+            except (ValueError, AssertionError) as e:
+                if log:
+                    log("%s: score %d: %s" % (source, number, e))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingest scores into a binary chorale corpus file")
+    parser.add_argument("output", help="corpus file to write")
+    parser.add_argument("sources", nargs="+",
+                        help="MusicXML, MIDI or other music21 files, glob patterns, or corpus:bach style "
+                             "composers and corpus:bach/bwv66.6 style works of the music21 corpus")
+    args = parser.parse_args(argv)
+
+    log = lambda message: print(message, file=sys.stderr)
+    with open(args.output, "wb") as f:
+        count = write_corpus(f, ingest(args.sources, log))
+    log("Wrote %d chorales to %s" % (count, args.output))
+    return 0 if count else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,203 @@
+"""Re-checks an edited chorale from the result of checking the previous version.
+
+The slices of the two versions are compared from both ends, which leaves one
+edited span. The key is re-estimated by taking the slices of the old span out
+of the pitch-class histogram and putting those of the new span in; if the
+estimate changes, every slice depends on the edit and the chorale is checked
+from scratch.
+
+Otherwise the rules of voice_leading.pipeline are restored from the last
+checkpoint of their state before the span, and stepped through the new slices
+until they are past the span and their state equals the one the old version
+had at one of its checkpoints. From there the old violations still hold, moved
+by the change in length. The rule states are saved every CHECKPOINT slices,
+and a note that waits for its resolution is the only state that names a slice,
+so the rules usually agree again at the first checkpoint after the span. Only the chords
+of the span are labeled again; the progression is parsed again over all the
+labels, which costs little next to labeling them.
+"""
+from bisect import bisect_right
+
+from voice_leading import pipeline
+from voice_leading.report import sort_violations
+
+from . import keys
+from .chorale import Chorale
+from .segmented import rule_states
+
+CHECKPOINT = 16
+
+
+class CheckedChorale:
+    """The violations of a chorale, with what re-checking an edited version of it needs.
+
+    >>> import utils
+    >>> voices = [['C5', 'D5', 'E5', 'C5'] * 16, ['F4', 'G4', 'G4', 'E4'] * 16,
+    ...           ['A3', 'B3', 'C4', 'G3'] * 16, ['F3', 'G3', 'C3', 'C3'] * 16]
+    >>> checked = CheckedChorale(utils.make_compact_chorale_from_strings(*voices))
+    >>> voices[0][41] = 'B4'
+    >>> edited = utils.make_compact_chorale_from_strings(*voices)
+    >>> rechecked = checked.recheck(edited)
+    >>> rechecked.violations() == CheckedChorale(edited).violations(), rechecked.stepped
+    (True, 16)
+    """
+    def __init__(self, chorale=None):
+        """Checks a compact Chorale or music21 score, as utils.chorale_results does
+        """
+        if chorale is None:
+            return
+        if not isinstance(chorale, Chorale):
+            chorale = Chorale.from_score(chorale)
+        self.slices = chorale.slices()
+        estimator = keys.KeyEstimator()
+        for codes in self.slices:
+            estimator.add(codes)
+        self.histogram = estimator.histogram
+        self.set_key(estimator.estimate())
+        self.labels = [self.label(codes) for codes in self.slices]
+        # (index of the slice being stepped, violation) in the order the rules emit them
+        self.emitted = []
+        self.checkpoints, self.states = [], []
+        self.stepped = self.step(pipeline.make_rules(self.leading_tone), 0)
+        self.parse()
+
+    def set_key(self, estimated):
+        self.key = estimated
+        self.leading_tone = keys.leading_tone(estimated) if estimated else None
+
+    def label(self, codes):
+        from harmony.helpers import get_chord_label
+        return get_chord_label(codes, keys.to_music21(self.key))
+
+    def step(self, rules, start, converge=None):
+        """Steps the rules from the slice at start to the end, saving checkpoints and emitted
+        violations, and returns the number of slices stepped. converge is an optional function
+        of the index of the next slice and the rules that returns whether to stop there.
+        """
+        for index in range(start, len(self.slices)):
+            if converge is not None and converge(index, rules):
+                return index - start
+            if not self.checkpoints or index - self.checkpoints[-1] >= CHECKPOINT:
+                self.checkpoints.append(index)
+                self.states.append(rule_states(rules))
+            out = []
+            for rule in rules:
+                rule.step(index, self.slices[index], out)
+            self.emitted += [(index, violation) for violation in out]
+        out = []
+        for rule in rules:
+            rule.finish(out)
+        self.emitted += [(len(self.slices), violation) for violation in out]
+        return len(self.slices) - start
+
+    def parse(self):
+        from harmony import parser
+        basses = [codes[0][1] for codes in self.slices]
+        major = self.key is not None and self.key[1] == "major"
+        self.harmony = parser.parse_progression(self.labels, major, basses).violations
+
+    def violations(self):
+        """Returns the voice leading violations, sorted, followed by the harmony violations
+        """
+        return sort_violations([violation for _, violation in self.emitted]) + self.harmony
+
+    def recheck(self, chorale):
+        """Returns the CheckedChorale of an edited version of this chorale, checking again only
+        what the edit can change. Its stepped attribute counts the slices the rules went through.
+        """
+        if not isinstance(chorale, Chorale):
+            chorale = Chorale.from_score(chorale)
+        new_slices = chorale.slices()
+        start, old_end, new_end = edited_span(self.slices, new_slices)
+        histogram = list(self.histogram)
+        for codes, sign in [(codes, -1) for codes in self.slices[start:old_end]] + \
+                           [(codes, 1) for codes in new_slices[start:new_end]]:
+            for midi, step in codes:
+                histogram[midi % 12] += sign
+        estimated = keys.best_key(histogram) if any(histogram) else None
+        if estimated != self.key:
+            return CheckedChorale(chorale)
+
+        shift = new_end - old_end
+
+        def move(index):
+            return index if index < start else index + shift
+
+        checked = CheckedChorale()
+        checked.slices = new_slices
+        checked.histogram = histogram
+        checked.set_key(estimated)
+        checked.labels = (self.labels[:start] + [checked.label(codes) for codes in new_slices[start:new_end]]
+                          + self.labels[old_end:])
+
+        # restart from the last checkpoint before the span
+        restart = bisect_right(self.checkpoints, start) - 1
+        checked.checkpoints = self.checkpoints[:restart]
+        checked.states = self.states[:restart]
+        checked.emitted = [(index, violation) for index, violation in self.emitted
+                           if index < self.checkpoints[restart]] if restart >= 0 else []
+        rules = pipeline.make_rules(self.leading_tone)
+        if restart >= 0:
+            restore_states(rules, self.states[restart])
+
+        def converge(index, rules):
+            old_index = index - shift
+            if index < new_end or old_index < old_end:
+                return False
+            old = bisect_right(self.checkpoints, old_index) - 1
+            if old < 0 or self.checkpoints[old] != old_index:
+                return False
+            moved = move_states(self.states[old], start, old_end, shift)
+            if moved != rule_states(rules):
+                return False
+            # the rest of the old run holds from here on, moved by the change in length
+            checked.checkpoints += [index + shift for index in self.checkpoints[old:]]
+            checked.states += [move_states(states, start, old_end, shift) for states in self.states[old:]]
+            checked.emitted += [(move(index), violation._replace(index=move(violation.index)))
+                                for index, violation in self.emitted if index >= old_index]
+            return True
+
+        checked.stepped = checked.step(rules, self.checkpoints[restart] if restart >= 0 else 0, converge)
+        checked.parse()
+        return checked
+
+
+def edited_span(old, new):
+    """Returns the start of the slices that differ between two sequences and the ends of
+    the differing spans in the old and new sequences.
+
+    >>> edited_span("abcde", "abxde"), edited_span("abc", "abxc"), edited_span("abc", "abc")
+    ((2, 3, 3), (2, 2, 3), (3, 3, 3))
+    """
+    start = 0
+    shortest = min(len(old), len(new))
+    while start < shortest and old[start] == new[start]:
+        start += 1
+    end = 0
+    while end < shortest - start and old[len(old) - 1 - end] == new[len(new) - 1 - end]:
+        end += 1
+    return start, len(old) - end, len(new) - end
+
+
+def restore_states(rules, states):
+    """Sets the state of every rule from rule_states
+    """
+    for rule, state in zip(rules, states):
+        for name, value in state.items():
+            setattr(rule, name, list(value) if isinstance(value, list) else value)
+
+
+def move_states(states, start, end, shift):
+    """Returns rule states with the notes waiting for a resolution moved by shift when they
+    come after the edited span from start to end, or None if one of them lies inside the span
+    """
+    moved = []
+    for state in states:
+        pending = state.get("pending")
+        if pending:
+            if any(start <= index < end for index, _, _ in pending):
+                return None
+            state = dict(state, pending=[(index + shift if index >= end else index, voice, first)
+                                         for index, voice, first in pending])
+        moved.append(state)
+    return moved
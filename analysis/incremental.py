@@ -0,0 +1,94 @@
+"""Incremental checking of a chorale that grows one slice at a time.
+
+Appending a slice only steps the voice leading rules through that slice and
+labels its chord, which is fed to a harmony.parser.ProgressionParser that
+reports a progression error once every candidate progression agrees on it.
+The key is re-estimated from a running pitch-class histogram, and the rules
+and the progression that depend on it are re-run over the whole chorale only
+when the estimate changes.
+"""
+from voice_leading import pipeline, report
+import harmony.helpers
+import harmony.parser
+
+from .keys import KeyEstimator, to_music21
+
+
+class IncrementalChecker:
+    """Holds the state of every rule for a growing chorale.
+
+    >>> checker = IncrementalChecker()
+    >>> checker.add([(48, 22), (64, 31), (67, 33), (72, 36)])
+    []
+    >>> checker.add([(50, 23), (65, 32), (69, 34), (74, 37)])
+    [Violation(rule='parallel_fifths', voices=('bass', 'alto'), index=1), ...]
+    """
+    def __init__(self):
+        self.slices = []
+        self.chords = []
+        self.labels = []
+        self.key_estimator = KeyEstimator()
+        self.estimated_key = None
+        self.key = None
+        self.key_free = pipeline.Checker(None, pipeline.make_key_free_rules())
+        self.key_rules = None
+        # the progression errors settled so far
+        self.harmony = []
+        self.parser = None
+
+    def add(self, codes, slice_chord=None):
+        """Appends a slice of (midi, step) codes ordered from the bass up and returns the
+        violations it revealed: the voice leading ones, sorted, then the progression errors
+        it settled. slice_chord is the music21 chord of the slice, built from the codes as
+        chordify would if not given and only when the codes are not in harmony.labels.TABLE.
+        """
+        self.slices.append(tuple(codes))
+        self.chords.append(slice_chord)
+        start = len(self.key_free.violations)
+        self.key_free.feed(self.slices[-1])
+        revealed = self.key_free.violations[start:]
+
+        self.key_estimator.add(codes)
+        estimated = self.key_estimator.estimate()
+        if estimated != self.estimated_key:
+            before = set(self.key_rules.violations + self.harmony) if self.key_rules else set()
+            self.change_key(estimated)
+            revealed += [v for v in self.key_rules.violations if v not in before]
+            harmony = [v for v in self.harmony if v not in before]
+        else:
+            start = len(self.key_rules.violations)
+            self.key_rules.feed(self.slices[-1])
+            revealed += self.key_rules.violations[start:]
+            harmony = self.feed_harmony(len(self.slices) - 1)
+            self.harmony += harmony
+        return report.sort_violations(revealed) + harmony
+
+    def change_key(self, estimated):
+        """Re-runs the rules and the progression that depend on the key over every slice
+        """
+        self.estimated_key = estimated
+        self.key = to_music21(estimated)
+        self.key_rules = pipeline.Checker(None, pipeline.make_key_rules(pipeline.key_leading_tone(self.key)))
+        for codes in self.slices:
+            self.key_rules.feed(codes)
+        self.labels = []
+        self.parser = harmony.parser.ProgressionParser()
+        self.harmony = []
+        for index in range(len(self.slices)):
+            self.harmony += self.feed_harmony(index)
+
+    def feed_harmony(self, index):
+        """Labels the chord at index, feeds it to the parser and returns the errors it settled
+        """
+        chord = self.chords[index] if self.chords[index] is not None else self.slices[index]
+        self.labels.append(harmony.helpers.get_chord_label(chord, self.key))
+        return self.parser.feed(self.labels[-1], self.key.mode == "major", self.slices[index][0][1])
+
+    def violations(self):
+        """Returns every voice leading violation followed by every harmony violation found so far,
+        counting the progression as if it ended with the last slice
+        """
+        if not self.key_rules:
+            return []
+        return (report.sort_violations(self.key_free.violations + self.key_rules.violations)
+                + self.harmony + self.parser.peek())
@@ -0,0 +1,274 @@
+"""Opt-in timing of the checkers' hot paths.
+
+enable() replaces the functions and methods listed in TARGETS with timed
+wrappers, and disable() puts the originals back, so nothing is measured and
+nothing is slowed down while instrumentation is off. Every call adds its
+duration to a histogram with exponential buckets, which gives call counts,
+cumulative time and an estimated p95. The hit rates of the interval and chord
+label caches are reported over the same period.
+
+    >>> from analysis import instrumentation
+    >>> import utils
+    >>> with instrumentation.instrumented():
+    ...     utils.check_chorale_errors(utils.read_chorale("chorales/c1.txt"))   # doctest: +SKIP
+    >>> print(instrumentation.format_table())                                   # doctest: +SKIP
+"""
+import functools
+import importlib
+import inspect
+import json
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# module -> names to instrument, where "*" stands for every public function defined in the module
+TARGETS = {
+    "voice_leading.error_checks": ["*"],
+    "voice_leading.helpers": ["*", "IntervalCache.get"],
+    "voice_leading.pipeline": ["report_chorale", "check_slices", "Checker.feed", "Checker.finish",
+                               "AugmentedSecondRule.step", "UnresolvedLeapRule.step",
+                               "UnresolvedLeadingToneRule.step", "UnresolvedSeventhRule.step",
+                               "UnresolvedSeventhRule.get_seventh", "SpacingRule.step",
+                               "VoiceCrossingRule.step", "VoiceOverlappingRule.step", "ParallelRule.step"],
+    "harmony.helpers": ["get_chord_label", "chord_from_codes", "get_grammar", "ChordWalker.__next__",
+                        "ChordWalker.get_label"],
+    "harmony.error_checks": ["check_chorale", "report_chorale", "find_progression_errors"],
+    "harmony.parser": ["parse_progression", "ProgressionParser.feed", "ProgressionParser.finish"],
+    "analysis.keys": ["best_key", "correlations", "KeyEstimator.estimate"],
+    "analysis.context": ["analyze_key", "chordify"],
+}
+
+# upper bounds in seconds of the histogram buckets, from a microsecond to about 17 seconds
+BUCKETS = [1e-6 * 2 ** i for i in range(25)]
+
+
+class Timer:
+    """Call count, cumulative time and duration histogram of one instrumented function.
+
+    >>> timer = Timer("f")
+    >>> for seconds in [0.001] * 19 + [0.1]:
+    ...     timer.record(seconds)
+    >>> timer.count, round(timer.total, 3)
+    (20, 0.119)
+    >>> timer.quantile(0.5) < 0.002 < timer.quantile(0.99)
+    True
+    """
+    __slots__ = ("name", "count", "total", "maximum", "buckets")
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+
+    def record(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.maximum:
+            self.maximum = seconds
+        self.buckets[bisect_left(BUCKETS, seconds)] += 1
+
+    def quantile(self, q):
+        """Returns an estimate of the q quantile of the durations, interpolated within its bucket
+        and never above the longest duration
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for i, n in enumerate(self.buckets):
+            if n and cumulative + n >= rank:
+                if i == len(BUCKETS):
+                    return self.maximum
+                low = BUCKETS[i - 1] if i else 0.0
+                return min(low + (BUCKETS[i] - low) * (rank - cumulative) / n, self.maximum)
+            cumulative += n
+        return self.maximum
+
+    def to_dict(self):
+        return {"calls": self.count, "seconds": self.total,
+                "mean_seconds": self.total / self.count if self.count else 0.0,
+                "p95_seconds": self.quantile(0.95), "max_seconds": self.maximum}
+
+
+timers = {}
+patches = []
+cache_baselines = {}
+
+
+def cache_counters():
+    """Returns {cache name: (hits, misses)} of the caches of the checkers
+    """
+    from voice_leading.helpers import interval_cache
+    from harmony.helpers import label_cache_stats
+    return {"interval": (interval_cache.hits, interval_cache.misses),
+            "chord_label": (label_cache_stats["hits"], label_cache_stats["misses"])}
+
+
+def is_enabled():
+    return bool(patches)
+
+
+def timed(timer, function):
+    """Returns a wrapper of function recording the duration of every call in timer.
+    A generator function is timed over every step of its generators, excluding the consumer's time.
+    """
+    perf_counter = time.perf_counter
+
+    if inspect.isgeneratorfunction(function):
+        @functools.wraps(function)
+        def generator_wrapper(*args, **kwargs):
+            elapsed = 0.0
+            generator = function(*args, **kwargs)
+            try:
+                while True:
+                    start = perf_counter()
+                    try:
+                        value = next(generator)
+                    except StopIteration:
+                        return
+                    finally:
+                        elapsed += perf_counter() - start
+                    yield value
+            finally:
+                generator.close()
+                timer.record(elapsed)
+        return generator_wrapper
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        start = perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            timer.record(perf_counter() - start)
+    return wrapper
+
+
+def resolve_targets():
+    """Yields (owner, attribute name, qualified name) of every target in TARGETS
+    """
+    for module_name, names in TARGETS.items():
+        module = importlib.import_module(module_name)
+        for name in names:
+            if name == "*":
+                for attribute, value in sorted(vars(module).items()):
+                    if (inspect.isfunction(value) and value.__module__ == module_name
+                            and not attribute.startswith("_")):
+                        yield module, attribute, module_name + "." + attribute
+                continue
+            owner = module
+            *path, attribute = name.split(".")
+            for part in path:
+                owner = getattr(owner, part)
+            if attribute not in vars(owner):
+                raise AttributeError("%s has no attribute %r to instrument" % (owner, attribute))
+            yield owner, attribute, module_name + "." + name
+
+
+def enable():
+    """Starts timing every target, from fresh counters. Does nothing if already enabled.
+    """
+    if patches:
+        return
+    reset()
+    for owner, attribute, name in resolve_targets():
+        original = vars(owner)[attribute]
+        timer = timers.setdefault(name, Timer(name))
+        setattr(owner, attribute, timed(timer, original))
+        patches.append((owner, attribute, original))
+
+
+def disable():
+    """Puts the original functions back. The counters are kept until the next enable or reset.
+    """
+    while patches:
+        owner, attribute, original = patches.pop()
+        setattr(owner, attribute, original)
+
+
+def reset():
+    """Clears the timers and starts counting cache hits from now
+    """
+    timers.clear()
+    cache_baselines.clear()
+    cache_baselines.update(cache_counters())
+
+
+@contextmanager
+def instrumented():
+    """Enables instrumentation for the duration of a with block
+    """
+    enable()
+    try:
+        yield
+    finally:
+        disable()
+
+
+def cache_stats():
+    """Returns {cache name: {"hits", "misses", "hit_rate"}} since instrumentation was enabled
+    """
+    stats = {}
+    for name, (hits, misses) in cache_counters().items():
+        base_hits, base_misses = cache_baselines.get(name, (0, 0))
+        # a cleared cache resets its counters
+        if hits < base_hits or misses < base_misses:
+            base_hits, base_misses = 0, 0
+        hits, misses = hits - base_hits, misses - base_misses
+        stats[name] = {"hits": hits, "misses": misses,
+                       "hit_rate": hits / (hits + misses) if hits + misses else 0.0}
+    return stats
+
+
+def summary():
+    """Returns the counters of every function called while instrumented, slowest first, and the cache stats
+    """
+    called = sorted((t for t in timers.values() if t.count), key=lambda t: -t.total)
+    return {"functions": {t.name: t.to_dict() for t in called}, "caches": cache_stats()}
+
+
+def to_json(**kwargs):
+    return json.dumps(summary(), **kwargs)
+
+
+def format_table():
+    """Returns the summary as a text table
+    """
+    lines = ["%-58s %10s %12s %12s %12s" % ("function", "calls", "total ms", "mean us", "p95 us")]
+    for name, stats in summary()["functions"].items():
+        lines.append("%-58s %10d %12.2f %12.2f %12.2f" % (
+            name, stats["calls"], stats["seconds"] * 1e3,
+            stats["mean_seconds"] * 1e6, stats["p95_seconds"] * 1e6))
+    lines.append("")
+    lines.append("%-58s %10s %12s %12s" % ("cache", "hits", "misses", "hit rate"))
+    for name, stats in cache_stats().items():
+        lines.append("%-58s %10d %12d %11.1f%%" % (name, stats["hits"], stats["misses"],
+                                                   stats["hit_rate"] * 100))
+    return "\n".join(lines)
+
+
+def to_prometheus(prefix="johann"):
+    """Returns the counters in the Prometheus text exposition format
+    """
+    lines = ["# HELP %s_call_seconds Duration of calls of instrumented functions" % prefix,
+             "# TYPE %s_call_seconds histogram" % prefix]
+    for name, timer in sorted(timers.items()):
+        if not timer.count:
+            continue
+        cumulative = 0
+        for bound, n in zip(BUCKETS + ["+Inf"], timer.buckets):
+            cumulative += n
+            le = bound if isinstance(bound, str) else "%g" % bound
+            lines.append('%s_call_seconds_bucket{function="%s",le="%s"} %d' % (prefix, name, le, cumulative))
+        lines.append('%s_call_seconds_sum{function="%s"} %r' % (prefix, name, timer.total))
+        lines.append('%s_call_seconds_count{function="%s"} %d' % (prefix, name, timer.count))
+
+    caches = cache_stats()
+    for counter in ["hits", "misses"]:
+        lines.append("# HELP %s_cache_%s_total Cache %s since instrumentation was enabled" % (prefix, counter, counter))
+        lines.append("# TYPE %s_cache_%s_total counter" % (prefix, counter))
+        for name, stats in caches.items():
+            lines.append('%s_cache_%s_total{cache="%s"} %d' % (prefix, counter, name, stats[counter]))
+    return "\n".join(lines) + "\n"
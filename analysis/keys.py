@@ -0,0 +1,149 @@
+"""Key estimation from pitch-class histograms without music21.
+
+This is the Aarden-Essen key-weight analysis music21 runs for analyze("key"),
+computed from a histogram that can be updated one slice at a time. Every slice
+lasts a quarter note, so each note adds one to the count of its pitch class.
+"""
+import numpy as np
+
+MAJOR_WEIGHTS = [17.7661, 0.145624, 14.9265, 0.160186, 19.8049, 11.3587,
+                 0.291248, 22.062, 0.145624, 8.15494, 0.232998, 4.95122]
+MINOR_WEIGHTS = [18.2648, 0.737619, 14.0499, 16.8599, 0.702494, 14.4362,
+                 0.702494, 18.6161, 4.56621, 1.93186, 7.37619, 1.75623]
+
+# tonic names music21 picks for each pitch class
+MAJOR_TONICS = ["C", "C#", "D", "E-", "E", "F", "F#", "G", "A-", "A", "B-", "B"]
+MINOR_TONICS = ["C", "C#", "D", "E-", "E", "F", "F#", "G", "G#", "A", "B-", "B"]
+
+MODES = ["major"] * 12 + ["minor"] * 12
+TONICS = MAJOR_TONICS + MINOR_TONICS
+
+
+def make_profiles():
+    """Returns a (24, 12) array of the mean-centered key profiles rotated to every tonic,
+    major keys first, and the norm of each profile
+    """
+    profiles = []
+    for weights in [MAJOR_WEIGHTS, MINOR_WEIGHTS]:
+        centered = np.array(weights) - np.mean(weights)
+        profiles += [np.roll(centered, tonic) for tonic in range(12)]
+    profiles = np.array(profiles)
+    return profiles, np.sqrt((profiles ** 2).sum(axis=1))
+
+
+PROFILES, PROFILE_NORMS = make_profiles()
+
+# music21 breaks ties in favor of the higher tonic pitch class, then of minor
+TIE_ORDER = np.lexsort((np.arange(24) >= 12, np.arange(24) % 12))[::-1]
+
+
+def correlations(histograms):
+    """Returns the correlation of every key profile with each histogram.
+    histograms has shape (..., 12) and the result has shape (..., 24).
+    """
+    histograms = np.asarray(histograms, dtype=float)
+    centered = histograms - histograms.mean(axis=-1, keepdims=True)
+    norms = np.sqrt((centered ** 2).sum(axis=-1, keepdims=True))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        result = (histograms @ PROFILES.T) / (PROFILE_NORMS * norms)
+    return np.nan_to_num(result, nan=0.0, posinf=0.0, neginf=0.0)
+
+
+def best_key(histogram):
+    """Returns the (tonic name, mode) of the key best fitting a pitch-class histogram.
+
+    >>> best_key([3, 0, 1, 0, 2, 1, 0, 3, 0, 1, 0, 1])
+    ('C', 'major')
+    """
+    scores = correlations(histogram)
+    best = TIE_ORDER[np.argmax(scores[TIE_ORDER])]
+    return TONICS[best], MODES[best]
+
+
+def slice_histograms(slices):
+    """Returns a (number of slices, 12) array of the pitch-class counts of each slice
+    """
+    midi = np.asarray([[code[0] for code in codes] for codes in slices], dtype=np.int64).reshape(len(slices), -1)
+    histograms = np.zeros((len(slices), 12))
+    np.add.at(histograms, (np.arange(len(slices))[:, np.newaxis], midi % 12), 1)
+    return histograms
+
+
+def window_keys(slices, window):
+    """Returns the (tonic name, mode) of the key of every slice, estimated from the window of
+    window slices centered on it. Windows are shifted inside the chorale at its ends, so a
+    chorale no longer than window gets the key of the whole chorale at every slice.
+
+    The histogram of every window is the difference of two prefix sums of the slice
+    histograms, and all windows are scored against the 24 key profiles at once.
+
+    >>> c, g = [(48, 22), (64, 31), (67, 33), (72, 36)], [(43, 19), (59, 28), (62, 30), (67, 33)]
+    >>> f, d = [(53, 25), (60, 29), (65, 32), (69, 34)], [(50, 23), (54, 25), (62, 30), (69, 34)]
+    >>> [tonic for tonic, mode in window_keys([c, f, g, c, g, d, g, d, g], 4)]
+    ['C', 'C', 'C', 'C', 'G', 'G', 'G', 'G', 'G']
+    """
+    if not len(slices):
+        return []
+    length = len(slices)
+    window = min(window, length)
+    prefix = np.zeros((length + 1, 12))
+    np.cumsum(slice_histograms(slices), axis=0, out=prefix[1:])
+    starts = np.clip(np.arange(length) - window // 2, 0, length - window)
+    scores = correlations(prefix[starts + window] - prefix[starts])
+    best = TIE_ORDER[np.argmax(scores[:, TIE_ORDER], axis=1)]
+    return [(TONICS[i], MODES[i]) for i in best]
+
+
+class KeyEstimator:
+    """Estimates the key of a growing chorale, updating its histogram one slice at a time.
+
+    >>> estimator = KeyEstimator()
+    >>> estimator.add([(43, 19), (59, 28), (62, 30), (67, 33)])
+    >>> estimator.add([(50, 23), (54, 25), (62, 30), (69, 34)])
+    >>> estimator.estimate()
+    ('G', 'major')
+    """
+    def __init__(self):
+        self.histogram = [0] * 12
+        self.estimated = None
+
+    def add(self, codes):
+        """Counts the (midi, step) codes of a slice
+        """
+        for midi, step in codes:
+            self.histogram[midi % 12] += 1
+        self.estimated = None
+
+    def estimate(self):
+        """Returns the (tonic name, mode) of the estimated key, or None before any slice
+        """
+        if not any(self.histogram):
+            return None
+        if self.estimated is None:
+            self.estimated = best_key(self.histogram)
+        return self.estimated
+
+
+def leading_tone(estimated):
+    """Returns the (midi, step) code of the leading tone music21 gives for a (tonic name, mode)
+    pair, a major seventh above the tonic in octave 4.
+
+    >>> leading_tone(('C', 'major')), leading_tone(('G#', 'minor'))
+    ((71, 35), (79, 39))
+    """
+    from voice_leading.pitches import parse_name
+    midi, step = parse_name(estimated[0])
+    return midi + 11, step + 6
+
+
+music21_keys = {}
+
+
+def to_music21(estimated):
+    """Returns the music21 key object of a (tonic name, mode) pair, shared by every caller
+    """
+    result = music21_keys.get(estimated)
+    if result is None:
+        from music21 import key
+        result = music21_keys[estimated] = key.Key(*estimated)
+    return result
@@ -0,0 +1,155 @@
+"""Bulk reader for the whitespace chorale text format.
+
+A chorale is four lines of note names, soprano first. A file may hold any
+number of chorales separated by blank lines, so a whole corpus can live in a
+single file. Files are memory-mapped and every token is looked up in a table
+of note names built once, which gives the pitch codes of a compact Chorale
+without going through music21.
+"""
+import mmap
+import os
+from collections import namedtuple
+
+from voice_leading.pitches import NAME_TABLE
+
+from .chorale import Chorale
+
+TOKEN_TABLE = {name.encode("ascii"): code for name, code in NAME_TABLE.items()}
+
+ChoraleRecord = namedtuple("ChoraleRecord", ["filename", "line", "chorale", "error"])
+ChoraleRecord.__doc__ = """A chorale read from filename starting at line, or the error that kept it from being read"""
+
+
+class ChoraleSyntaxError(ValueError):
+    def __init__(self, filename, line, column, reason):
+        self.filename = filename
+        self.line = line
+        self.column = column
+        self.reason = reason
+        self.message = "%s:%d:%d: %s" % (filename, line, column, reason)
+        ValueError.__init__(self, self.message)
+
+    def __reduce__(self):
+        # records carrying errors are sent to worker processes
+        return ChoraleSyntaxError, (self.filename, self.line, self.column, self.reason)
+
+
+def iter_lines(filename):
+    """Yields (line number, line bytes) for every line of a file, read through a memory map
+    """
+    with open(filename, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            line_number = 0
+            for line in iter(m.readline, b""):
+                line_number += 1
+                yield line_number, line
+
+
+def parse_line(filename, line_number, line):
+    """Returns the (midi, step) codes of the notes on a line.
+    Raises a ChoraleSyntaxError pointing at the first token that is not a note name.
+    """
+    try:
+        return [TOKEN_TABLE[token] for token in line.split()]
+    except KeyError:
+        pass
+
+    column = 0
+    for token in line.split():
+        column = line.index(token, column)
+        if token not in TOKEN_TABLE:
+            raise ChoraleSyntaxError(filename, line_number, column + 1,
+                                     "invalid note %r" % token.decode("ascii", "replace"))
+        column += len(token)
+
+
+def parse_block(filename, lines):
+    """Returns the Chorale of four (line number, line bytes) pairs, soprano first
+    """
+    voices = [parse_line(filename, line_number, line) for line_number, line in lines]
+    lengths = [len(voice) for voice in voices]
+    if len(set(lengths)) > 1:
+        common = max(lengths, key=lengths.count)
+        line_number = next(lines[i][0] for i, n in enumerate(lengths) if n != common)
+        raise ChoraleSyntaxError(filename, line_number, 1,
+                                 "voices must have same length, found %s" % lengths)
+    voices.reverse()
+    return Chorale([[code[0] for code in voice] for voice in voices],
+                   [[code[1] for code in voice] for voice in voices])
+
+
+def read_file(filename):
+    """Yields a ChoraleRecord for every chorale of a file.
+    A malformed chorale gives a record with its ChoraleSyntaxError and reading goes on.
+    """
+    return read_lines(filename, iter_lines(filename))
+
+
+def read_text(text, filename="<text>"):
+    """Yields a ChoraleRecord for every chorale of a string or bytes in the file format,
+    reported under the given filename.
+
+    >>> [len(record.chorale) for record in read_text("C5 D5\\nE4 F4\\nG3 A3\\nC3 D3\\n")]
+    [2]
+    """
+    if isinstance(text, str):
+        text = text.encode("ascii", "replace")
+    return read_lines(filename, enumerate(text.splitlines(True), 1))
+
+
+def read_lines(filename, lines):
+    """Yields a ChoraleRecord for every chorale of an iterable of (line number, line bytes)
+    """
+    block = []
+    for line_number, line in lines:
+        if line.strip():
+            block.append((line_number, line))
+            if len(block) < 4:
+                continue
+        elif not block:
+            continue
+        elif len(block) < 4:
+            error = ChoraleSyntaxError(filename, block[0][0], 1,
+                                       "expected 4 voices, found %d" % len(block))
+            yield ChoraleRecord(filename, block[0][0], None, error)
+            block = []
+            continue
+
+        try:
+            yield ChoraleRecord(filename, block[0][0], parse_block(filename, block), None)
+        except ChoraleSyntaxError as e:
+            yield ChoraleRecord(filename, block[0][0], None, e)
+        block = []
+
+    if block:
+        error = ChoraleSyntaxError(filename, block[0][0], 1, "expected 4 voices, found %d" % len(block))
+        yield ChoraleRecord(filename, block[0][0], None, error)
+
+
+def find_files(path):
+    """Returns the chorale files of a directory, searched recursively, or [path] for a file
+    """
+    if not os.path.isdir(path):
+        return [path]
+    result = []
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        result += [os.path.join(root, name) for name in sorted(files) if name.endswith(".txt")]
+    return result
+
+
+def read_chorales(*paths):
+    """Yields a ChoraleRecord for every chorale in the given files and directories.
+
+    >>> records = list(read_chorales("chorales/c1.txt", "chorales/c9.txt"))
+    >>> len(records[0].chorale)
+    15
+    >>> print(records[1].error)
+    chorales/c9.txt:2:1: voices must have same length, found [14, 13, 14, 14]
+    """
+    for path in paths:
+        for filename in find_files(path):
+            for record in read_file(filename):
+                yield record
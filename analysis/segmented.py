@@ -0,0 +1,199 @@
+"""Checks very long chorales in segments on a process pool, with the same result as a serial run.
+
+    python -m analysis.segmented generated.txt --workers 8 --segment-size 4096
+
+The slices are cut into segments, and every worker steps the rules of
+voice_leading.pipeline through its segment and labels its chords. Before its
+segment a worker replays WARM_UP slices, so that its rules start from the state
+they would have reached in a serial run: the previous slice of the two-slice
+rules, the last motion of the leap rule and the notes still waiting for a
+resolution. Each worker keeps only the violations emitted while stepping
+through its own segment.
+
+The state each worker started from is then compared with the state the
+previous segment ended in. A mismatch, left by a note held longer than the
+warm-up, is repaired by re-running that segment from the right state in the
+main process, so the stitched result always equals the serial one. The
+progression is parsed once over all the labels, which is cheap next to
+labeling the chords.
+"""
+import argparse
+import json
+import sys
+from multiprocessing import Pool
+
+from voice_leading import pipeline
+from voice_leading.report import sort_violations
+
+from . import keys
+from .chorale import Chorale
+from .context import AnalysisContext
+
+SEGMENT_SIZE = 4096
+WARM_UP = 64
+
+# attributes of the rules that configure them rather than hold their state
+CONFIGURATION = ("voices", "voice_ids", "leading_tone")
+
+
+class Window:
+    """Stands for the values of a longer sequence from offset on, indexed like the longer sequence.
+
+    >>> Window(["c", "d"], 5)[6]
+    'd'
+    """
+    __slots__ = ("values", "offset")
+
+    def __init__(self, values, offset):
+        self.values = values
+        self.offset = offset
+
+    def __getitem__(self, index):
+        return self.values[index - self.offset]
+
+
+def rule_states(rules):
+    """Returns the state of every rule as a list of dicts that later steps do not change
+    """
+    return [{name: list(value) if isinstance(value, list) else value
+             for name, value in vars(rule).items() if name not in CONFIGURATION}
+            for rule in rules]
+
+
+def leading_tones(slice_keys, offset):
+    """Returns the leading tone argument of a Checker given the (tonic name, mode) of the chorale,
+    or the list of the keys of the slices from offset on
+    """
+    if isinstance(slice_keys, tuple):
+        return keys.leading_tone(slice_keys)
+    codes = {estimated: keys.leading_tone(estimated) for estimated in set(slice_keys)}
+    return Window([codes[estimated] for estimated in slice_keys], offset)
+
+
+def step_segment(checker, slices, start):
+    """Feeds the slices to a checker from index start and returns the violations they emitted
+    """
+    checker.index = start
+    checker.violations = []
+    for codes in slices:
+        checker.feed(codes)
+    return checker.violations
+
+
+def label_slices(slices, slice_keys):
+    """Returns the figure of the chord of every slice in its key
+    """
+    from harmony.helpers import get_chord_label
+    if isinstance(slice_keys, tuple):
+        slice_keys = [slice_keys] * len(slices)
+    return [get_chord_label(codes, keys.to_music21(estimated)) for codes, estimated in zip(slices, slice_keys)]
+
+
+def check_segment(slices, warm_start, start, slice_keys):
+    """Checks the slices from start on after replaying those from warm_start, given the slices
+    and the keys (one pair, or a list from warm_start on) from warm_start to the end of the segment.
+    Returns the violations of the segment, the rule states at start, the rules at the end
+    and the labels of the segment.
+    """
+    checker = pipeline.Checker(leading_tones(slice_keys, warm_start))
+    step_segment(checker, slices[:start - warm_start], warm_start)
+    states = rule_states(checker.rules)
+    violations = step_segment(checker, slices[start - warm_start:], start)
+    segment_keys = slice_keys if isinstance(slice_keys, tuple) else slice_keys[start - warm_start:]
+    return violations, states, checker.rules, label_slices(slices[start - warm_start:], segment_keys)
+
+
+def segment_tasks(slices, slice_keys, segment_size, warm_up):
+    """Yields the arguments of check_segment for every segment
+    """
+    for start in range(0, len(slices), segment_size):
+        end = min(start + segment_size, len(slices))
+        warm_start = max(start - warm_up, 0)
+        segment_keys = slice_keys if isinstance(slice_keys, tuple) else slice_keys[warm_start:end]
+        yield slices[warm_start:end], warm_start, start, segment_keys
+
+
+def check_chorale(chorale, workers=None, segment_size=SEGMENT_SIZE, warm_up=WARM_UP, key_window=None):
+    """Returns the voice leading violations, sorted, followed by the harmony violations of a compact
+    Chorale or music21 score, as utils.chorale_results finds them for the compact chorale.
+
+    >>> import utils
+    >>> chorale = utils.make_compact_chorale_from_strings(*[voice * 20 for voice in
+    ...     [['C5', 'D5', 'G5'], ['F4', 'G4', 'B4'], ['A3', 'B3', 'D4'], ['F3', 'G3', 'G2']]])
+    >>> results = utils.chorale_results(chorale)["violations"]
+    >>> [utils.violation_to_dict(v) for v in check_chorale(chorale, 1, segment_size=7, warm_up=2)] == results
+    True
+    """
+    from harmony import parser
+
+    if not isinstance(chorale, Chorale):
+        chorale = Chorale.from_score(chorale)
+    context = AnalysisContext(chorale, key_window=key_window)
+    slices = context.slices
+    slice_keys = context.local_keys or context.estimated_key
+    if not slices:
+        return []
+
+    tasks = list(segment_tasks(slices, slice_keys, segment_size, warm_up))
+    if workers == 1 or len(tasks) == 1:
+        results = [check_segment(*task) for task in tasks]
+    else:
+        with Pool(workers) as pool:
+            results = pool.starmap(check_segment, tasks)
+
+    violations, labels, rules = [], [], None
+    full_leading_tones = leading_tones(slice_keys, 0)
+    for (segment, warm_start, start, _), (emitted, states, end_rules, segment_labels) in zip(tasks, results):
+        if rules is not None and rule_states(rules) != states:
+            # the warm-up was too short: step through the segment again from the right state
+            checker = pipeline.Checker(None, rules)
+            emitted = step_segment(checker, segment[start - warm_start:], start)
+            end_rules = checker.rules
+        for rule in end_rules:
+            if isinstance(rule, pipeline.UnresolvedLeadingToneRule):
+                rule.leading_tone = full_leading_tones
+        violations += emitted
+        labels += segment_labels
+        rules = end_rules
+    for rule in rules:
+        rule.finish(violations)
+
+    modes = [estimated[1] == "major" for estimated in
+             (slice_keys if isinstance(slice_keys, list) else [slice_keys] * len(slices))]
+    basses = [codes[0][1] for codes in slices]
+    return sort_violations(violations) + parser.parse_progression(labels, modes, basses).violations
+
+
+def main(argv=None):
+    import utils
+    from analysis import corpus, reader
+
+    arg_parser = argparse.ArgumentParser(description="Check long chorales in parallel segments")
+    arg_parser.add_argument("files", nargs="+", help="chorale text files or binary corpus files")
+    arg_parser.add_argument("-w", "--workers", type=int, help="number of worker processes (default: number of cores)")
+    arg_parser.add_argument("-s", "--segment-size", type=int, default=SEGMENT_SIZE,
+                            help="slices per segment (default: %d)" % SEGMENT_SIZE)
+    arg_parser.add_argument("--warm-up", type=int, default=WARM_UP,
+                            help="slices replayed before each segment (default: %d)" % WARM_UP)
+    arg_parser.add_argument("-k", "--key-window", type=int, help="slices per key window, as in batch.py")
+    args = arg_parser.parse_args(argv)
+
+    ok = True
+    for filename in args.files:
+        read_file = corpus.read_file if filename.endswith(".jcb") else reader.read_file
+        for record in read_file(filename):
+            result = {"file": record.filename, "line": record.line}
+            if record.error:
+                ok = False
+                result.update({"ok": False, "error": "%s: %s" % (type(record.error).__name__, record.error)})
+            else:
+                violations = check_chorale(record.chorale, args.workers, args.segment_size,
+                                           args.warm_up, args.key_window)
+                result.update({"ok": True, "length": len(record.chorale),
+                               "violations": [utils.violation_to_dict(v) for v in violations]})
+            print(json.dumps(result))
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
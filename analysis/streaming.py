@@ -0,0 +1,151 @@
+"""Checks a chorale fed one slice at a time, without keeping it in memory.
+
+    python -m analysis.streaming --key "G major" < slices.txt
+
+The rules of voice_leading.pipeline already step through the slices with
+bounded state, so the checker keeps only that state and the progression parser
+of harmony.parser, whose candidate progressions are forgotten as soon as they
+agree. Every violation is returned by the feed that decides it: most of them
+with their own slice, a note waiting for its resolution when the voice moves
+on, and a progression error a few chords later. A leading tone or seventh
+still waiting at the end of the stream is reported as unresolved.
+
+Without a given key, the first KEY_SLICES slices are held back and the key is
+estimated from them, as analysis.keys.KeyEstimator estimates it for a whole
+chorale. For a chorale no longer than that, or given the key of the whole
+chorale, the violations are those of utils.chorale_results plus the notes left
+unresolved at the end.
+"""
+import argparse
+import json
+import sys
+
+from voice_leading import pipeline
+from voice_leading.report import sort_violations
+
+from . import keys
+
+KEY_SLICES = 32
+
+
+class StreamChecker:
+    """Checks the slices of a chorale as they come.
+
+    >>> checker = StreamChecker(("C", "major"))
+    >>> checker.feed([(53, 25), (57, 27), (65, 32), (72, 36)])
+    []
+    >>> checker.feed([(55, 26), (59, 28), (67, 33), (74, 37)])
+    [Violation(rule='parallel_fifths', voices=('bass', 'soprano'), index=1), ...]
+    >>> checker.feed([(43, 19), (59, 28), (62, 30), (71, 35)])
+    []
+    >>> checker.finish()
+    [Violation(rule='unresolved_leading_tone', voices=('soprano',), index=2)]
+    """
+    def __init__(self, key=None, key_slices=KEY_SLICES, report_pending=True):
+        """key is the (tonic name, mode) of the chorale, estimated from its first key_slices
+        slices if not given. report_pending reports the notes still waiting for a resolution
+        at the end, which utils.chorale_results counts as resolved.
+        """
+        from harmony.parser import ProgressionParser
+        self.key_slices = key_slices
+        self.report_pending = report_pending
+        self.parser = ProgressionParser()
+        self.rules = None
+        self.index = 0
+        self.buffered = []
+        self.key_estimator = keys.KeyEstimator()
+        self.key = None
+        if key is not None:
+            self.set_key(key)
+
+    def set_key(self, key):
+        self.key = key
+        self.music21_key = keys.to_music21(key)
+        self.major = key[1] == "major"
+        self.rules = pipeline.make_rules(keys.leading_tone(key))
+
+    def feed(self, codes):
+        """Checks the next slice of (midi, step) codes, ordered from the bass up,
+        and returns the violations decided since the last call
+        """
+        if self.key is not None:
+            return self.check(tuple(codes))
+        self.buffered.append(tuple(codes))
+        self.key_estimator.add(codes)
+        if len(self.buffered) < self.key_slices:
+            return []
+        return self.release()
+
+    def release(self):
+        """Estimates the key from the buffered slices and checks them
+        """
+        self.set_key(self.key_estimator.estimate())
+        buffered, self.buffered = self.buffered, []
+        violations = []
+        for codes in buffered:
+            violations += self.check(codes)
+        return violations
+
+    def check(self, codes):
+        from harmony.helpers import get_chord_label
+        out = []
+        for rule in self.rules:
+            rule.step(self.index, codes, out)
+        self.index += 1
+        label = get_chord_label(codes, self.music21_key)
+        return sort_violations(out) + self.parser.feed(label, self.major, codes[0][1])
+
+    def finish(self):
+        """Ends the stream and returns the violations still undecided
+        """
+        violations = self.release() if self.buffered else []
+        if self.rules is None:
+            return violations
+        out = []
+        for rule in self.rules:
+            if self.report_pending and isinstance(rule, pipeline.ResolutionRule):
+                rule.flush(out)
+            rule.finish(out)
+        return violations + sort_violations(out) + self.parser.finish()
+
+
+def check_stream(slices, key=None, key_slices=KEY_SLICES, report_pending=True):
+    """Yields the violations of an iterable of slices as soon as they are decided
+    """
+    checker = StreamChecker(key, key_slices, report_pending)
+    for codes in slices:
+        yield from checker.feed(codes)
+    yield from checker.finish()
+
+
+def read_slices(lines):
+    """Yields the slices of lines of four note names, soprano first, skipping blank lines
+    """
+    from .reader import ChoraleSyntaxError, parse_line
+    for line_number, line in enumerate(lines, 1):
+        line = line.encode("ascii", "replace")
+        if line.strip():
+            codes = parse_line("<stdin>", line_number, line)
+            if len(codes) != 4:
+                raise ChoraleSyntaxError("<stdin>", line_number, 1, "expected 4 notes, found %d" % len(codes))
+            yield tuple(reversed(codes))
+
+
+def main(argv=None):
+    import utils
+
+    arg_parser = argparse.ArgumentParser(description="Check a chorale read one slice per line from stdin, "
+                                                     "soprano first, printing each violation when it is decided")
+    arg_parser.add_argument("-k", "--key", help="key of the chorale, as a tonic name and mode, e.g. 'G major'")
+    arg_parser.add_argument("--key-slices", type=int, default=KEY_SLICES,
+                            help="slices the key is estimated from when not given (default: %d)" % KEY_SLICES)
+    args = arg_parser.parse_args(argv)
+
+    key = tuple(args.key.split()) if args.key else None
+    for violation in check_stream(read_slices(sys.stdin), key, args.key_slices):
+        print(json.dumps(utils.violation_to_dict(violation)), flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,183 @@
+"""Checks a corpus of chorale text or binary corpus files on a process pool.
+
+    python batch.py chorales/ "more/**/*.txt" --workers 8 --chunksize 4
+    python batch.py chorales/ --profile table
+    python batch.py chorales/ --cache ~/.cache/johann
+
+A text file may hold several chorales separated by blank lines, and a .jcb
+corpus file written by analysis.corpus any number of them. Every chorale gets
+one JSON line with its violations, or with the error that kept it from being
+checked, as soon as it is done. A summary line comes last.
+
+With --cache, results are kept in an analysis.cache.ResultCache shared by the
+workers, and a chorale already checked under the same rules is not checked
+again.
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from collections import Counter
+from functools import partial
+from multiprocessing import Pool
+
+# binary corpus files written by analysis.corpus
+CORPUS_SUFFIX = ".jcb"
+
+
+def expand_path(path):
+    """Returns the chorale files of a directory, or the files matching a glob pattern
+    """
+    if os.path.isdir(path):
+        files = []
+        for pattern in ["*.txt", "*" + CORPUS_SUFFIX]:
+            files += glob.glob(os.path.join(path, "**", pattern), recursive=True)
+        return files
+    return glob.glob(path, recursive=True)
+
+
+def find_files(paths):
+    """Expands directories and glob patterns into a sorted list of chorale files
+    """
+    return sorted({filename for path in paths for filename in expand_path(path)})
+
+
+def unmatched_results(paths):
+    """Returns an error result for every path that matches no chorale file, like the result
+    of a file that could not be read
+    """
+    return [{"file": path, "line": 0, "ok": False,
+             "error": "FileNotFoundError: no chorale files match %r" % path}
+            for path in paths if not expand_path(path)]
+
+
+def check_record(record, cache=None, key_window=None):
+    """Checks one analysis.reader.ChoraleRecord and returns its result as a dict.
+    Errors are reported in the result instead of being raised. With an
+    analysis.cache.ResultCache, unchanged chorales are answered from the cache.
+    key_window is passed to utils.chorale_results.
+    """
+    import utils
+
+    start = time.perf_counter()
+    result = {"file": record.filename, "line": record.line}
+    try:
+        if record.error:
+            raise record.error
+        hits = cache.hits if cache is not None else 0
+        result.update(utils.chorale_results(record.chorale, cache, key_window))
+    except Exception as e:
+        result.update({"ok": False, "error": "%s: %s" % (type(e).__name__, e),
+                       "seconds": time.perf_counter() - start})
+        return result
+
+    result.update({"ok": True, "cached": cache is not None and cache.hits > hits,
+                   "seconds": time.perf_counter() - start})
+    return result
+
+
+def read_records(files):
+    """Yields the ChoraleRecord of every chorale in the files
+    """
+    from analysis import corpus, reader
+    for filename in files:
+        read_file = corpus.read_file if filename.endswith(CORPUS_SUFFIX) else reader.read_file
+        try:
+            for record in read_file(filename):
+                yield record
+        except OSError as e:
+            yield reader.ChoraleRecord(filename, 0, None, e)
+
+
+def check_files(files, workers=None, chunksize=1, cache=None, key_window=None):
+    """Yields the result of every chorale of the files as soon as it is available,
+    in no particular order when more than one worker is used
+    """
+    records = read_records(files)
+    if workers == 1:
+        for record in records:
+            yield check_record(record, cache, key_window)
+        return
+
+    with Pool(workers) as pool:
+        for result in pool.imap_unordered(partial(check_record, cache=cache, key_window=key_window), records, chunksize):
+            yield result
+
+
+def summarize(results, seconds):
+    """Returns the summary record of a list of results
+    """
+    by_rule = Counter(v["rule"] for r in results if r["ok"] for v in r["violations"])
+    return {"summary": {"chorales": len(results),
+                        "checked": sum(1 for r in results if r["ok"]),
+                        "failed": sum(1 for r in results if not r["ok"]),
+                        "cached": sum(1 for r in results if r.get("cached")),
+                        "violations": sum(by_rule.values()),
+                        "by_rule": dict(by_rule),
+                        "seconds": seconds}}
+
+
+def profile_report(profile_format):
+    """Returns the instrumentation summary of the run in the given format
+    """
+    from analysis import instrumentation
+    if profile_format == "json":
+        return instrumentation.to_json(indent=2)
+    if profile_format == "prometheus":
+        return instrumentation.to_prometheus()
+    return instrumentation.format_table()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check chorale files in parallel")
+    parser.add_argument("paths", nargs="+", help="chorale files, directories or glob patterns")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count(),
+                        help="number of worker processes (default: number of cores)")
+    parser.add_argument("-c", "--chunksize", type=int, default=1,
+                        help="number of chorales sent to a worker at a time")
+    parser.add_argument("-o", "--output", help="file to write JSON lines to (default: stdout)")
+    parser.add_argument("-k", "--key-window", type=int,
+                        help="give every slice the key of the window of this many slices around it, "
+                             "for modulating chorales, such as 16 (default: one key per chorale)")
+    parser.add_argument("--cache", metavar="DIRECTORY",
+                        help="directory of a result cache to reuse the results of unchanged chorales")
+    parser.add_argument("--cache-size", type=int, default=256,
+                        help="size in MiB above which the least recently used results are evicted (default: 256)")
+    parser.add_argument("--profile", choices=["table", "json", "prometheus"],
+                        help="time the checkers in a single process and print the profile to stderr")
+    args = parser.parse_args(argv)
+    if args.profile:
+        from analysis import instrumentation
+        args.workers = 1
+        instrumentation.enable()
+
+    cache = None
+    if args.cache:
+        from analysis.cache import ResultCache
+        cache = ResultCache(args.cache, args.cache_size << 20)
+
+    files = find_files(args.paths)
+    output = open(args.output, "w") if args.output else sys.stdout
+    start = time.perf_counter()
+    results = unmatched_results(args.paths)
+    try:
+        for result in results:
+            output.write(json.dumps(result) + "\n")
+        for result in check_files(files, args.workers, args.chunksize, cache, args.key_window):
+            results.append(result)
+            output.write(json.dumps(result) + "\n")
+            output.flush()
+        output.write(json.dumps(summarize(results, time.perf_counter() - start)) + "\n")
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        if args.profile:
+            instrumentation.disable()
+            sys.stderr.write(profile_report(args.profile) + "\n")
+    return 0 if all(r["ok"] for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
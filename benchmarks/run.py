@@ -0,0 +1,230 @@
+"""Times the checkers on synthetic chorales and writes the results as JSON.
+
+    python -m benchmarks.run --sizes 16 256 4096 --output results.json
+    python -m benchmarks.run --output new.json --compare results.json
+
+Every benchmark runs on the same synthetic chorale of each size, with the
+interval and chord label caches cleared before each run, and reports the best
+of --repeat runs as slices per second. Peak memory is measured with
+tracemalloc in a separate run so it does not slow down the timed ones.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from itertools import combinations
+
+from . import synthetic
+
+
+def clear_caches():
+    """Clears the caches the checkers fill, so that every run starts cold
+    """
+    from voice_leading import helpers
+    import harmony.helpers
+    helpers.interval_cache.clear()
+    harmony.helpers.label_cache.clear()
+
+
+def rule_benchmarks(voices, chorale_key):
+    """Returns (name, function) pairs running each find_* rule of voice_leading.error_checks
+    over the voices check_chorale runs it on
+    """
+    from voice_leading import error_checks as ec
+
+    bass, tenor, alto, soprano = voices
+    pairs = list(zip(voices[:-1], voices[1:]))
+    all_pairs = list(combinations(voices, 2))
+
+    def run(find, arguments):
+        return lambda: [list(find(*a)) for a in arguments]
+
+    return [
+        ("augmented_seconds", run(ec.find_augmented_seconds, [(v,) for v in voices])),
+        ("unresolved_leaps", run(ec.find_unresolved_leaps, [(v,) for v in voices[1:]])),
+        ("unresolved_sevenths", run(ec.find_unresolved_sevenths, [(voices,)])),
+        ("unresolved_leading_tones",
+         run(ec.find_unresolved_leading_tones, [(bass, chorale_key), (soprano, chorale_key)])),
+        ("spacing", run(ec.find_spacing_errors, pairs[1:])),
+        ("voice_crossing", run(ec.find_voice_crossings, pairs)),
+        ("voice_overlapping", run(ec.find_voice_overlaps, pairs)),
+        ("parallel_fifths", run(ec.find_parallel_fifths, all_pairs)),
+        ("parallel_octaves", run(ec.find_parallel_octaves, all_pairs)),
+        ("parallel_fourths", run(ec.find_parallel_fourths, [(bass, soprano)])),
+        ("direct_fifths", run(ec.find_direct_fifths, [(bass, soprano)])),
+        ("direct_octaves", run(ec.find_direct_octaves, [(bass, soprano)])),
+    ]
+
+
+def make_benchmarks(strings, filename):
+    """Returns (name, function) pairs of every benchmark of a chorale given its note name
+    lists, soprano first, and the file it was written to
+    """
+    import utils
+    import harmony.error_checks
+    from harmony import helpers, parser
+    from harmony.errors import ChordProgressionError
+    from analysis import reader
+    from analysis.context import AnalysisContext
+    from voice_leading import error_checks, pipeline
+
+    score = utils.make_chorale_from_strings(*strings)
+    context = AnalysisContext(score)
+    chords, chorale_key = context.chords, context.key
+    compact = utils.make_compact_chorale_from_strings(*strings)
+    labels = [helpers.get_chord_label(c, chorale_key) for c in chords]
+    major = chorale_key.mode == "major"
+    basses = [codes[0][1] for codes in context.slices]
+
+    def stream_progression():
+        progression = parser.ProgressionParser()
+        for label, bass in zip(labels, basses):
+            progression.feed(label, major, bass)
+        return progression.finish()
+
+    def walk_chords():
+        walker = helpers.ChordWalker(chords, chorale_key)
+        for _ in range(len(chords) - 1):
+            try:
+                next(walker)
+            except (ChordProgressionError, AssertionError):
+                walker.index += 1
+
+    def quiet(check):
+        def run():
+            with contextlib.redirect_stdout(io.StringIO()):
+                check(AnalysisContext(score, chorale_key))
+        return run
+
+    benchmarks = [("error_checks." + name, run)
+                  for name, run in rule_benchmarks(context.voices, chorale_key)]
+    benchmarks += [
+        ("error_checks.check_chorale", quiet(error_checks.check_chorale)),
+        ("harmony.check_chorale", quiet(harmony.error_checks.check_chorale)),
+        ("harmony.find_progression_errors",
+         lambda: harmony.error_checks.find_progression_errors(chords, chorale_key)),
+        ("harmony.parse_progression", lambda: parser.parse_progression(labels, major, basses)),
+        ("harmony.ProgressionParser", stream_progression),
+        ("harmony.ChordWalker", walk_chords),
+        ("pipeline.report_chorale", lambda: pipeline.report_chorale(AnalysisContext(compact, chorale_key))),
+        ("utils.read_chorale", lambda: utils.read_chorale(filename)),
+        ("reader.read_file", lambda: list(reader.read_file(filename))),
+    ]
+    return benchmarks
+
+
+def time_run(run, repeat):
+    """Returns the best time in seconds of repeat cold runs
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        clear_caches()
+        start = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def peak_memory(run):
+    """Returns the peak number of bytes allocated during a cold run
+    """
+    clear_caches()
+    tracemalloc.start()
+    try:
+        run()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run_benchmarks(sizes, seed=0, repeat=3, memory=True, only=None, log=None):
+    """Returns a result dict for every benchmark on a synthetic chorale of every size.
+    only restricts the benchmarks to those whose name contains one of its strings.
+    """
+    results = []
+    for size in sizes:
+        strings, faults = synthetic.make_chorale(size, seed)
+        fd, filename = tempfile.mkstemp(suffix=".txt")
+        os.close(fd)
+        try:
+            synthetic.write_chorale(filename, size, seed)
+            for name, run in make_benchmarks(strings, filename):
+                if only and not any(s in name for s in only):
+                    continue
+                seconds = time_run(run, repeat)
+                result = {"benchmark": name, "slices": size, "seconds": seconds,
+                          "slices_per_second": size / seconds if seconds else None,
+                          "peak_bytes": peak_memory(run) if memory else None}
+                results.append(result)
+                if log:
+                    log(format_result(result))
+        finally:
+            os.remove(filename)
+    return results
+
+
+def format_result(result, previous=None):
+    """Returns a table line of a result, with the speedup over a previous result if given
+    """
+    line = "%-42s %7d %12.0f slices/s" % (result["benchmark"], result["slices"], result["slices_per_second"])
+    if result["peak_bytes"] is not None:
+        line += " %10.1f KiB" % (result["peak_bytes"] / 1024)
+    if previous:
+        line += "  x%.2f" % (result["slices_per_second"] / previous["slices_per_second"])
+    return line
+
+
+def compare(results, previous_results, threshold=0.9):
+    """Prints every result next to its speedup over the matching previous result,
+    and returns the results that are slower than threshold times the previous ones
+    """
+    previous = {(r["benchmark"], r["slices"]): r for r in previous_results}
+    regressions = []
+    for result in results:
+        match = previous.get((result["benchmark"], result["slices"]))
+        print(format_result(result, match))
+        if match and result["slices_per_second"] < threshold * match["slices_per_second"]:
+            regressions.append(result)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the chorale checkers on synthetic chorales")
+    parser.add_argument("-s", "--sizes", type=int, nargs="+", default=[16, 256, 4096],
+                        help="numbers of slices of the chorales (default: 16 256 4096)")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the synthetic chorales")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="runs per benchmark, the best is kept")
+    parser.add_argument("-k", "--only", nargs="+", help="run only benchmarks whose name contains one of these")
+    parser.add_argument("--no-memory", action="store_true", help="skip the peak memory runs")
+    parser.add_argument("-o", "--output", help="JSON file to write the results to")
+    parser.add_argument("--compare", help="JSON file of a previous run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.9,
+                        help="ratio of previous throughput under which a result is a regression")
+    args = parser.parse_args(argv)
+
+    log = None if args.compare else print
+    results = run_benchmarks(args.sizes, args.seed, args.repeat, not args.no_memory, args.only, log)
+
+    if args.output:
+        meta = {"python": platform.python_version(), "platform": platform.platform(),
+                "seed": args.seed, "repeat": args.repeat, "time": time.strftime("%Y-%m-%dT%H:%M:%S")}
+        with open(args.output, "w") as f:
+            json.dump({"meta": meta, "results": results}, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f)["results"], args.threshold)
+        for result in regressions:
+            print("regression: %s at %d slices" % (result["benchmark"], result["slices"]))
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+"""Reproducible synthetic four-part chorales for benchmarking.
+
+The chorales are in C major and realize a random walk over I, ii, IV, V and vi
+with every voice moving to the nearest chord tone in its range. Faults are
+written over the realization at known indices: parallel fifths between bass
+and soprano, an unresolved leap in the alto and an unresolved seventh in the
+alto. Other errors may still appear where the voices happen to collide.
+"""
+import random
+
+LETTERS = "CDEFGAB"
+
+# diatonic steps of the root of each chord above C, and the chords that may follow it
+CHORDS = {"I": 0, "ii": 1, "IV": 3, "V": 4, "vi": 5}
+PROGRESSIONS = {"I": ["IV", "ii", "V", "vi"], "ii": ["V"], "IV": ["V", "I", "ii"],
+                "V": ["I", "vi"], "vi": ["ii", "IV"]}
+
+# voice ranges as diatonic steps, music21's diatonicNoteNum
+RANGES = {"bass": (17, 29), "tenor": (24, 34), "alto": (28, 37), "soprano": (31, 41)}
+
+FAULTS = ["parallel_fifths", "unresolved_leap", "unresolved_seventh"]
+
+
+def step_name(step):
+    """Returns the name of a natural note given its diatonic step.
+
+    >>> step_name(29)
+    'C4'
+    """
+    octave, letter = divmod(step - 1, 7)
+    return LETTERS[letter] + str(octave)
+
+
+def nearest_chord_tone(previous, root, low, high):
+    """Returns the step of the chord tone in [low, high] closest to previous
+    """
+    tones = [s for s in range(low, high + 1) if (s - 1 - root) % 7 in (0, 2, 4)]
+    return min(tones, key=lambda s: (abs(s - previous), s))
+
+
+def realize(length, rng):
+    """Returns the progression and the bass, tenor, alto and soprano steps of a chorale
+    """
+    progression = ["I"]
+    while len(progression) < length:
+        progression.append(rng.choice(PROGRESSIONS[progression[-1]]))
+
+    voices = {voice_id: [] for voice_id in RANGES}
+    previous = {voice_id: (low + high) // 2 for voice_id, (low, high) in RANGES.items()}
+    for label in progression:
+        root = CHORDS[label]
+        bass_low, bass_high = RANGES["bass"]
+        bass = [s for s in range(bass_low, bass_high + 1) if (s - 1 - root) % 7 == 0]
+        lower = min(bass, key=lambda s: abs(s - previous["bass"]))
+        voices["bass"].append(lower)
+        for voice_id in ["tenor", "alto", "soprano"]:
+            low, high = RANGES[voice_id]
+            step = nearest_chord_tone(previous[voice_id], root, max(low, lower), high)
+            voices[voice_id].append(step)
+            lower = step
+        previous = {voice_id: steps[-1] for voice_id, steps in voices.items()}
+    return progression, voices
+
+
+def add_fault(voices, fault, index):
+    """Writes a fault over the voices so that it is reported at index
+    """
+    bass, alto, soprano = voices["bass"], voices["alto"], voices["soprano"]
+    if fault == "parallel_fifths":
+        # C and D in the bass under G and A two octaves and a fifth above
+        bass[index - 1], bass[index] = 22, 23
+        soprano[index - 1], soprano[index] = 40, 41
+    elif fault == "unresolved_leap":
+        # a step settling any earlier leap, then a leap up a sixth followed by a step up
+        alto[index - 3], alto[index - 2], alto[index - 1], alto[index] = 28, 29, 34, 35
+    elif fault == "unresolved_seventh":
+        # V7 with the seventh in the alto, which then moves up
+        bass[index], voices["tenor"][index], alto[index], soprano[index] = 19, 28, 32, 35
+        alto[index + 1] = 33
+
+
+def make_chorale(length, seed=0, fault_every=16):
+    """Returns the soprano, alto, tenor and bass note name lists of a synthetic chorale,
+    and a list of (fault, index) pairs for the faults written into it.
+
+    >>> strings, faults = make_chorale(16, seed=1)
+    >>> [len(voice) for voice in strings]
+    [16, 16, 16, 16]
+    >>> faults
+    [('parallel_fifths', 8)]
+    """
+    rng = random.Random(seed)
+    progression, voices = realize(length, rng)
+
+    faults = []
+    if fault_every:
+        for n, index in enumerate(range(fault_every // 2, length - 2, fault_every)):
+            fault = FAULTS[n % len(FAULTS)]
+            add_fault(voices, fault, index)
+            faults.append((fault, index))
+
+    strings = [[step_name(step) for step in voices[voice_id]]
+               for voice_id in ["soprano", "alto", "tenor", "bass"]]
+    return strings, faults
+
+
+def write_chorale(filename, length, seed=0, fault_every=16):
+    """Writes a synthetic chorale in the text format read by utils.read_chorale
+    and returns its faults
+    """
+    strings, faults = make_chorale(length, seed, fault_every)
+    with open(filename, "w") as f:
+        for voice in strings:
+            f.write(" ".join(voice) + "\n")
+    return faults
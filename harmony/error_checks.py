@@ -1,29 +1,49 @@
-from music21 import chord
-from .errors import *
-from . import helpers
+from analysis.context import get_context
+from . import helpers, parser
+
+RULES = ["chord_progression", "unknown_chord"]
 
 
 def check_chorale(chorale, print_result=True):
-    num_errors = 0
-    chorale_key = chorale.analyze("key")
-    chorale_chords = helpers.get_chords(chorale)
-
-    # Check chord progressions
-    # TODO: support passing chords, secondary dominants, sequences
-    chord_walker = helpers.ChordWalker(chorale_chords, chorale_key)
-
-    for i in range(len(chorale_chords) - 1):
-        try:
-            next(chord_walker)
-        except ChordProgressionError as e:
-            num_errors += 1
-            print("Chord progression error found at index", e.index)
-            chord_walker.index += 1
-        except AssertionError as e:
-            num_errors += 1
-            print(e.args[0])
-            chord_walker.index += 1
+    """Prints every chord progression error in the chorale, which may also be an AnalysisContext.
+    """
+    violations = report_chorale(chorale)
+    for violation in violations:
+        print(format_violation(violation))
 
     if print_result:
-            print("Harmony check completed\n Result: %d errors" % num_errors)
+            print("Harmony check completed\n Result: %d errors" % len(violations))
+
+
+def find_progression_errors(chorale_chords, chorale_key, basses=None, costs=parser.COSTS):
+    """Returns the violations of the progression of the chords with the fewest errors, found by
+    parser.parse_progression. chorale_key is a music21 key or a list of the key of every chord,
+    and basses the optional diatonic steps of the basses, which let passing chords through.
+    The chords are music21 chords or slices of (midi, step) codes, as get_chord_label takes them.
+    """
+    keys = chorale_key if type(chorale_key) is list else [chorale_key] * len(chorale_chords)
+    labels = [helpers.get_chord_label(c, k) for c, k in zip(chorale_chords, keys)]
+    return parser.parse_progression(labels, [k.mode == "major" for k in keys], basses, costs).violations
+
+
+def format_violation(violation):
+    """Returns the line check_chorale prints for a violation
+
+    >>> from voice_leading.report import Violation
+    >>> format_violation(Violation("unknown_chord", (), 3))
+    'No expected chords given'
+    """
+    if violation.rule == "chord_progression":
+        return "Chord progression error found at index %d" % violation.index
+    return "No expected chords given"
+
 
+def report_chorale(chorale):
+    """Returns every harmony error of the chorale, which may also be an AnalysisContext,
+    as a list of voice_leading.report.Violation records
+    """
+    context = get_context(chorale)
+    # the chords of a compact chorale are its slices, labeled from the codes without music21 chords
+    chords = context.slices if context.compact is not None else context.chords
+    basses = [codes[0][1] for codes in context.slices]
+    return find_progression_errors(chords, context.chord_keys, basses if len(basses) == len(chords) else None)
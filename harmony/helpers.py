@@ -1,48 +1,186 @@
-from music21 import roman, key, chord
+from types import MappingProxyType
+
 from .errors import *
+from . import labels
 
-# TODO: fix 7 chords--investivate music21 labeling (e.g. viio#63)
 # TODO: better handling of getting nexts of a 7 chord
 
 
+# music21 labels of the chords outside labels.TABLE, shared across chorales,
+# keyed by (pitch names with octave, tonic, mode)
+label_cache = {}
+LABEL_CACHE_SIZE = 65536
+label_cache_stats = {"hits": 0, "misses": 0}
+
+
+def get_chord_label(c, chorale_key):
+    """Returns the roman numeral figure of a chord in a music21 key. The chord is a music21
+    chord or a sequence of (midi, step) codes. The chords of the grammar are looked up in
+    labels.TABLE, and the others are labeled by music21 and memoized across chorales.
+
+    >>> from music21 import chord, key
+    >>> get_chord_label(chord.Chord(['G2', 'B3', 'D4', 'G4']), key.Key('G'))
+    'I'
+    >>> get_chord_label(chord.Chord(['D3', 'A-3', 'C4', 'F4']), key.Key('c'))
+    'iio7'
+    """
+    from voice_leading.pitches import code_name, encode_pitch
+    from_codes = isinstance(c, (tuple, list))
+    codes = c if from_codes else [encode_pitch(p) for p in c.pitches]
+    label = labels.label_codes(codes, chorale_key.tonic.pitchClass, chorale_key.mode)
+    if label is not None:
+        return label
+
+    if from_codes:
+        # the pitches of the chord chord_from_codes builds, without building it
+        codes = chord_codes(codes)
+    cache_key = (tuple(code_name(code) for code in codes), chorale_key.tonic.name, chorale_key.mode)
+    label = label_cache.get(cache_key)
+    if label is not None:
+        label_cache_stats["hits"] += 1
+    else:
+        label_cache_stats["misses"] += 1
+        from music21 import roman
+        if len(label_cache) >= LABEL_CACHE_SIZE:
+            label_cache.clear()
+        if from_codes:
+            c = chord_from_codes(codes)
+        label = roman.romanNumeralFromChord(c, chorale_key).figure
+        label_cache[cache_key] = label
+    return label
+
+
+def chord_from_codes(codes):
+    """Returns the music21 chord chordify builds for a slice of (midi, step) codes,
+    which holds each distinct pitch once, ordered by diatonic step.
+
+    >>> chord_from_codes([(43, 19), (55, 26), (62, 30), (67, 33)])
+    <music21.chord.Chord G2 G3 D4 G4>
+    """
+    from music21 import chord
+    from voice_leading.pitches import code_name
+    return chord.Chord([code_name(code) for code in chord_codes(codes)])
+
+
+def chord_codes(codes):
+    """Returns the distinct codes of a slice ordered by diatonic step, as chord_from_codes holds them
+    """
+    return sorted(set(codes), key=lambda code: (code[1], code[0]))
+
+
 class ChordWalker:
     def __init__(self, chords, chorale_key):
         """Chords is a list of music21 chord objects.
-        chorale_key is a music21 key object
+        chorale_key is a music21 key object, or a list of the key of every chord
         """
+        from .parser import ProgressionParser
         assert len(chords) > 0, "No given chords to walk"
         self.chords = chords
         self.key = chorale_key
+        self.keys = chorale_key if type(chorale_key) is list else None
         self.labeled_chords = []
         self.index = 0
+        # each chord is labeled at most once, the first time a label is asked for
+        self.labels = [None] * len(chords)
+        self.parser = ProgressionParser()
+        self.fed = 0
+        self.violations = []
 
     def __next__(self):
-        current_rn = roman.romanNumeralFromChord(self.chords[self.index], self.key)
-        self.labeled_chords.append(current_rn.figure)
-        new_index = self.find_next()
-        if new_index != self.index + 1:
-            raise ChordProgressionError(self.index - 1)
-        self.index = new_index
-            
-
-    def find_next(self):
-        """Returns the index and chord of the next chord in
-        the list of expected chords
+        """Walks from the chord at index to the next one. Every violation the parser
+        settles, which may be that of an earlier chord, is raised by one call, leaving
+        index unchanged: a ChordProgressionError, or an AssertionError for a chord outside
+        the grammar. Those settled by the last chord are raised by the calls after it.
+
+        >>> from music21 import chord, key
+        >>> walker = ChordWalker([chord.Chord(names) for names in
+        ...                       [["C4", "E4", "G4"], ["G3", "B3", "D4"], ["F4", "A4", "C5"]]], key.Key("C"))
+        >>> next(walker)
+        >>> next(walker)
+        Traceback (most recent call last):
+        ...
+        harmony.errors.ChordProgressionError: Found invalid chord progression at index 2
         """
+        while self.fed <= min(self.index + 1, len(self.chords) - 1):
+            key = self.key_at(self.fed)
+            self.violations += self.parser.feed(self.get_label(self.fed), key.mode == "major")
+            self.fed += 1
+            if self.fed == len(self.chords):
+                self.violations += self.parser.finish()
+        if self.violations:
+            violation = self.violations.pop(0)
+            if violation.rule == "unknown_chord":
+                raise AssertionError("No expected chords given")
+            raise ChordProgressionError(violation.index)
         assert self.index + 1 < len(self.chords), "No more chords to walk"
-        current_chord = self.chords[self.index]
-        current_rn = roman.romanNumeralFromChord(current_chord, self.key)
-        expected_chord_labels = get_expected_next(current_rn.figure, self.key.type == "major")
-        assert len(expected_chord_labels) > 0, "No expected chords given"
-        for i, c in enumerate(self.chords[self.index + 1:]):
-            rn = roman.romanNumeralFromChord(c, self.key)
-            if rn.figure in expected_chord_labels:
-                return self.index + i + 1
+        self.labeled_chords.append(self.get_label(self.index))
+        self.index += 1
+
+    def get_label(self, index):
+        """Returns the roman numeral figure of the chord at index
+        """
+        label = self.labels[index]
+        if label is None:
+            label = get_chord_label(self.chords[index], self.key_at(index))
+            self.labels[index] = label
+        return label
+
+    def key_at(self, index):
+        """Returns the key of the chord at index
+        """
+        return self.keys[index] if self.keys is not None else self.key
 
     def get_naive_chord_label(self, index):
-        chord = self.chords[index]
-        rn = roman.romanNumeralFromChord(chord, self.key)
-        return rn.figure
+        return self.get_label(index)
+
+
+class ProgressionGrammar:
+    """The progression grammar of one mode compiled into frozensets.
+    transitions maps every known chord label to the frozenset of labels that may follow it.
+    """
+    def __init__(self, major_key = True):
+        self.major_key = major_key
+        self.tonics = frozenset(get_tonics(major_key))
+        self.dominants = frozenset(get_dominants(major_key))
+        self.predominants = frozenset(get_predominants(major_key))
+
+        transitions = {}
+        # later functions overwrite earlier ones to match the precedence of get_expected_next
+        for chord_labels, get_nexts in [(self.predominants, get_predominant_nexts),
+                                        (self.dominants, get_dominant_nexts),
+                                        (self.tonics, get_tonic_nexts)]:
+            for chord_label in chord_labels:
+                transitions[chord_label] = frozenset(get_nexts(chord_label, major_key))
+        self.transitions = MappingProxyType(transitions)
+        self.labels = tuple(sorted(transitions))
+
+    def expected_next(self, chord_label):
+        """Returns the frozenset of labels that may follow chord_label
+        """
+        return self.transitions.get(chord_label, frozenset())
+
+    def allows(self, chord_label, next_label):
+        """Returns whether next_label may follow chord_label
+        """
+        return next_label in self.expected_next(chord_label)
+
+
+grammars = {}
+
+
+def get_grammar(major_key = True):
+    """Returns the compiled ProgressionGrammar of a mode, compiling it on first use.
+
+    >>> get_grammar(True).allows("IV", "V")
+    True
+    >>> get_grammar(True).allows("V", "IV")
+    False
+    """
+    major_key = bool(major_key)
+    grammar = grammars.get(major_key)
+    if grammar is None:
+        grammar = grammars[major_key] = ProgressionGrammar(major_key)
+    return grammar
 
 
 def get_expected_next(chord_label, major_key = True):
@@ -97,7 +235,7 @@ def get_tonic_nexts(chord_label, major_key = True):
 
 
 def is_tonic(chord_label, major_key = True):
-    return chord_label in get_tonics(major_key)
+    return chord_label in get_grammar(major_key).tonics
 
 
 def get_dominants(major_key):
@@ -129,7 +267,7 @@ def get_dominant_nexts(chord_label, major_key = True):
 
 
 def is_dominant(chord_label, major_key = True):
-    return chord_label in get_dominants(major_key)
+    return chord_label in get_grammar(major_key).dominants
 
 
 def get_predominants(major_key = True):
@@ -188,12 +326,13 @@ def get_predominant_nexts(chord_label, major_key = True):
 
 
 def is_predominant(chord_label, major_key = True):
-    return chord_label in get_predominants(major_key)
+    return chord_label in get_grammar(major_key).predominants
 
 
 def get_chords(chorale):
-    chorale_key = chorale.analyze("key")
-    chord_list = filter(lambda x: type(x) is chord.Chord, chorale.chordify().recurse())
-    return list(chord_list)
+    """Returns the chords of a chorale or of an AnalysisContext
+    """
+    from analysis.context import get_context
+    return get_context(chorale).chords
 
 
@@ -0,0 +1,89 @@
+"""Roman numeral figures of the chords the progression grammar knows, from a table.
+
+Every diatonic chord of the grammar is entered for each of the 24 keys, once
+for every inversion and once more without its fifth, keyed by its pitch-class
+mask, bass pitch class, tonic pitch class and mode. A chord is then labeled
+with one dict lookup. The figures are the ones the grammar in harmony.helpers
+uses: diminished and half-diminished sevenths are both written o7, as in
+viio7 and iio7. Chords outside the table are left to music21.
+"""
+
+# pitch classes above the root of each chord quality, in chord step order
+TRIADS = {"major": (0, 4, 7), "minor": (0, 3, 7), "diminished": (0, 3, 6)}
+SEVENTHS = {"dominant": (0, 4, 7, 10), "minor": (0, 3, 7, 10), "major": (0, 4, 7, 11),
+            "half-diminished": (0, 3, 6, 10), "diminished": (0, 3, 6, 9)}
+
+TRIAD_INVERSIONS = ["", "6", "64"]
+SEVENTH_INVERSIONS = ["7", "65", "43", "42"]
+
+# (numeral, semitones of the root above the tonic, qualities) of the chords of the grammar
+MAJOR_TRIADS = [("I", 0, "major"), ("ii", 2, "minor"), ("iii", 4, "minor"),
+                ("IV", 5, "major"), ("V", 7, "major"), ("vi", 9, "minor")]
+MAJOR_SEVENTHS = [("ii", 2, ["minor"]), ("IV", 5, ["major"]), ("V", 7, ["dominant"]),
+                  ("viio", 11, ["half-diminished", "diminished"])]
+MINOR_TRIADS = [("i", 0, "minor"), ("iv", 5, "minor"), ("V", 7, "major"), ("VI", 8, "major")]
+MINOR_SEVENTHS = [("iio", 2, ["half-diminished"]), ("iv", 5, ["minor"]), ("V", 7, ["dominant"]),
+                  ("viio", 11, ["diminished", "half-diminished"])]
+
+
+def mask(pitch_classes):
+    result = 0
+    for pitch_class in pitch_classes:
+        result |= 1 << pitch_class % 12
+    return result
+
+
+def chord_entries(root, intervals, figures):
+    """Yields (mask, bass pitch class, figure) of every inversion of a chord,
+    complete and without its fifth
+    """
+    pitch_classes = [(root + interval) % 12 for interval in intervals]
+    without_fifth = pitch_classes[:2] + pitch_classes[3:]
+    for position, figure in enumerate(figures):
+        bass = pitch_classes[position]
+        yield mask(pitch_classes), bass, figure
+        if position != 2:
+            yield mask(without_fifth), bass, figure
+
+
+def make_table():
+    """Returns the dict mapping (mask, bass pitch class, tonic pitch class, mode) to figures
+    """
+    table = {}
+    for mode, triads, sevenths in [("major", MAJOR_TRIADS, MAJOR_SEVENTHS),
+                                   ("minor", MINOR_TRIADS, MINOR_SEVENTHS)]:
+        for tonic in range(12):
+            for numeral, degree, quality in triads:
+                figures = [numeral + inversion for inversion in TRIAD_INVERSIONS]
+                for chord_mask, bass, figure in chord_entries(tonic + degree, TRIADS[quality], figures):
+                    table.setdefault((chord_mask, bass, tonic, mode), figure)
+            for numeral, degree, qualities in sevenths:
+                figures = [numeral + inversion for inversion in SEVENTH_INVERSIONS]
+                for quality in qualities:
+                    for chord_mask, bass, figure in chord_entries(tonic + degree, SEVENTHS[quality], figures):
+                        table.setdefault((chord_mask, bass, tonic, mode), figure)
+    return table
+
+
+TABLE = make_table()
+
+
+def label(pitch_class_mask, bass, tonic, mode):
+    """Returns the figure of a chord given its pitch-class mask, the pitch class of its bass,
+    the pitch class of the tonic and the mode, or None if the grammar has no such chord.
+
+    >>> label(mask([7, 11, 2, 5]), 11, 0, "major")
+    'V65'
+    >>> label(mask([2, 5, 8, 0]), 2, 0, "minor")
+    'iio7'
+    >>> label(mask([0, 4]), 4, 0, "major")
+    'I6'
+    >>> label(mask([0, 1, 2]), 0, 0, "major")
+    """
+    return TABLE.get((pitch_class_mask, bass, tonic, mode))
+
+
+def label_codes(codes, tonic, mode):
+    """Returns the figure of a slice of (midi, step) codes, or None if it is not in the table
+    """
+    return TABLE.get((mask(code[0] for code in codes), min(codes)[0] % 12, tonic, mode))
@@ -0,0 +1,214 @@
+"""Finds the progression of a chorale with the fewest errors under the grammar.
+
+Every chord is either kept in the progression or left out of it. Two kept
+chords in a row cost an error when the grammar does not let the first go to
+the second. Leaving a chord out costs COSTS.passing if it is a passing chord,
+its bass moving by step in the same direction into and out of it, and
+COSTS.skip otherwise, and a chord outside the grammar must be left out.
+The cheapest choice over the whole chorale is found by dynamic programming
+whose states are the label and mode of the last kept chord, so a chorale is
+parsed in O(n * |labels|) steps whatever its errors.
+
+The violations are the disallowed steps, at the chord reached, the chords
+left out that are not passing chords, as chord_progression errors, and the
+chords outside the grammar that are not passing chords, as unknown_chord
+errors.
+"""
+import copy
+from collections import namedtuple
+
+from voice_leading.report import Violation
+from . import helpers
+
+Costs = namedtuple("Costs", ["error", "skip", "passing", "unknown"])
+Costs.__doc__ = """Costs of a disallowed step, of a chord left out, of a passing chord left out
+and of a chord outside the grammar"""
+
+COSTS = Costs(error=1.0, skip=1.0, passing=0.0, unknown=1.0)
+
+Parse = namedtuple("Parse", ["violations", "kept", "cost"])
+Parse.__doc__ = """The violations of the best progression, the indices of its chords and its cost"""
+
+
+def is_passing(previous, bass, following):
+    """Returns whether a bass passes by step in one direction from previous to following
+    """
+    step = bass - previous
+    return step in (1, -1) and following - bass == step
+
+
+def passing_chords(basses):
+    """Returns whether each chord is a passing chord given the diatonic steps of the basses.
+
+    >>> passing_chords([22, 23, 24, 24, 23])
+    [False, True, False, False, False]
+    """
+    return [0 < i < len(basses) - 1 and is_passing(basses[i - 1], basses[i], basses[i + 1])
+            for i in range(len(basses))]
+
+
+class ProgressionParser:
+    """Parses a progression fed one chord at a time, with state bounded by the number of labels
+    and by how far back the candidate progressions still differ.
+
+    A chord is parsed once the next bass tells whether it is a passing chord. With settle set,
+    feed returns the violations every candidate progression agrees on as soon as they do, and
+    forgets them; finish returns the rest, and peek the rest if the progression ended now.
+    Without settle, finish returns the whole Parse.
+
+    >>> parser = ProgressionParser()
+    >>> [parser.feed(label) for label in ["I", "V", "ii"]], parser.peek()
+    ([[], [], []], [Violation(rule='chord_progression', voices=(), index=2)])
+    >>> [parser.feed(label) for label in ["I", "IV", "V", "I"]]
+    [[], [], [Violation(rule='chord_progression', voices=(), index=2)], []]
+    >>> parser.finish()
+    []
+    """
+    def __init__(self, costs=COSTS, settle=True):
+        self.costs = costs
+        self.settle = settle
+        # state -> (cost, trail), where a state is (label, major) of the last kept chord, or None
+        # before any, and a trail is a linked list [index, kept, rule or None, previous trail]
+        self.best = {None: (0.0, None)}
+        # ties go to the state seen first, as if none had been pruned
+        self.ranks = {None: 0}
+        self.index = 0
+        self.waiting = None
+        self.previous_bass = None
+
+    def feed(self, label, major_key=True, bass=None):
+        """Adds the next chord given its label, mode and the diatonic step of its bass,
+        and returns the violations decided since the last call
+        """
+        if self.waiting is not None:
+            waiting_label, waiting_major, waiting_bass = self.waiting
+            passing = (self.previous_bass is not None and waiting_bass is not None and bass is not None
+                       and is_passing(self.previous_bass, waiting_bass, bass))
+            self.step(waiting_label, waiting_major, passing)
+            self.previous_bass = waiting_bass
+        self.waiting = (label, major_key, bass)
+        return self.settled() if self.settle else []
+
+    def step(self, label, major, passing):
+        costs = self.costs
+        i = self.index
+        self.index += 1
+        known = bool(helpers.get_grammar(major).expected_next(label))
+        if passing:
+            cost, rule = costs.passing, None
+        elif known:
+            cost, rule = costs.skip, "chord_progression"
+        else:
+            cost, rule = costs.unknown, "unknown_chord"
+        following = {state: (total + cost, [i, False, rule, trail]) for state, (total, trail) in self.best.items()}
+
+        if known:
+            kept = None
+            for state, (total, trail) in self.best.items():
+                allowed = state is None or helpers.get_grammar(state[1]).allows(state[0], label)
+                if not allowed:
+                    total += costs.error
+                if kept is None or total < kept[0]:
+                    kept = (total, [i, True, None if allowed else "chord_progression", trail])
+            state = (label, major)
+            self.ranks.setdefault(state, len(self.ranks))
+            # keeping a chord wins ties with leaving it out
+            if state not in following or kept[0] <= following[state][0]:
+                following[state] = kept
+
+        # from any state the next kept chord costs at most an error more than from another,
+        # so a state more than an error behind the best can never catch up
+        bound = min(total for total, _ in following.values()) + costs.error
+        self.best = {state: following[state] for state in sorted(following, key=self.ranks.__getitem__)
+                     if following[state][0] <= bound}
+
+    def settled(self):
+        """Returns the violations of the newest chord all candidate trails share and of the chords
+        before it, and cuts the trails there
+        """
+        trails = [trail for _, trail in self.best.values()]
+        positions = {}
+        node = trails[0]
+        while node is not None:
+            positions[id(node)] = len(positions)
+            node = node[3]
+        common = 0
+        for trail in trails[1:]:
+            node = trail
+            while node is not None and id(node) not in positions:
+                node = node[3]
+            if node is None:
+                return []
+            common = max(common, positions[id(node)])
+        node = trails[0]
+        for _ in range(common):
+            node = node[3]
+        return self.cut(node)
+
+    def cut(self, node):
+        """Returns the violations of a trail up to node and forgets them
+        """
+        violations = []
+        while node is not None:
+            if node[2]:
+                violations.append(Violation(node[2], (), node[0]))
+                node[2] = None
+            node[3], node = None, node[3]
+        return violations[::-1]
+
+    def close(self):
+        """Parses the last chord and returns the cost and trail of the best progression
+        """
+        if self.waiting is not None:
+            self.step(self.waiting[0], self.waiting[1], False)
+            self.waiting = None
+        return min(self.best.values(), key=lambda value: value[0])
+
+    def peek(self):
+        """Returns the violations finish would return if the progression ended now, leaving
+        the parser as it is
+        """
+        parser = copy.copy(self)
+        parser.ranks = dict(self.ranks)
+        total, trail = parser.close()
+        violations = []
+        while trail is not None:
+            index, _, rule, trail = trail
+            if rule:
+                violations.append(Violation(rule, (), index))
+        return violations[::-1]
+
+    def finish(self):
+        """Parses the last chord and returns the remaining violations, or the whole Parse
+        without settle
+        """
+        total, trail = self.close()
+        if self.settle:
+            return self.cut(trail)
+        violations, kept = [], []
+        while trail is not None:
+            index, is_kept, rule, trail = trail
+            if rule:
+                violations.append(Violation(rule, (), index))
+            if is_kept:
+                kept.append(index)
+        return Parse(violations[::-1], kept[::-1], total)
+
+
+def parse_progression(labels, major_key=True, basses=None, costs=COSTS):
+    """Returns the Parse of the cheapest progression through the chord labels.
+    major_key is a boolean or a list of one per chord, and basses the optional
+    diatonic steps of the basses, without which no chord is a passing chord.
+
+    >>> parse_progression(["I", "V", "ii", "I", "IV", "V", "I"]).violations
+    [Violation(rule='chord_progression', voices=(), index=2)]
+    >>> parse_progression(["I", "IV", "V64", "IV6", "V", "I"], basses=[22, 25, 24, 23, 26, 22]).kept
+    [0, 1, 3, 4, 5]
+    >>> parse_progression(["I", "I6", "V9", "I"]).violations
+    [Violation(rule='unknown_chord', voices=(), index=2)]
+    """
+    modes = major_key if isinstance(major_key, list) else [major_key] * len(labels)
+    parser = ProgressionParser(costs, settle=False)
+    for i, (label, major) in enumerate(zip(labels, modes)):
+        parser.feed(label, major, basses[i] if basses is not None else None)
+    return parser.finish()
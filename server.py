@@ -0,0 +1,287 @@
+"""Long-running checker service over HTTP on localhost or a Unix socket.
+
+    python server.py --port 8765 --workers 4
+    python server.py --unix /tmp/johann.sock
+
+POST /check takes a JSON object with one of
+    {"text": "<chorales in the text format>"}
+    {"names": {"soprano": [...], "alto": [...], "tenor": [...], "bass": [...]}}
+    {"codes": [[[midi, step], ...], ...]}   four voices from the bass up
+or a text/plain body in the text format, and answers {"results": [...]} with
+one result per chorale, as batch.py writes them. GET /health answers with
+the server counters.
+
+Checks run on a pool of worker processes that import everything and check a
+chorale once at startup, so every request finds music21, the grammars and the
+label caches warm. At most --max-pending checks are queued or running; beyond
+that requests get 503 right away. A check taking longer than --timeout seconds
+gets 504.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+MAX_BODY = 1 << 20
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           413: "Payload Too Large", 503: "Service Unavailable", 504: "Gateway Timeout"}
+WARM_UP = "C5 D5 E5\nE4 F4 G4\nG3 B3 C4\nC3 G2 C3\n"
+# values of the 16-bit arrays of analysis.chorale.Chorale
+CODE_RANGE = range(-1 << 15, 1 << 15)
+
+
+class RequestError(Exception):
+    def __init__(self, status, message):
+        self.status = status
+        self.message = message
+        Exception.__init__(self, message)
+
+
+def warm_up():
+    """Runs in every worker process before its first request
+    """
+    check_payload({"text": WARM_UP})
+
+
+def payload_records(payload):
+    """Returns the analysis.reader.ChoraleRecord list of a request payload
+    """
+    from analysis import reader
+    from analysis.chorale import Chorale
+
+    if "text" in payload:
+        return list(reader.read_text(payload["text"], "<request>"))
+    if "names" in payload:
+        names = payload["names"]
+        try:
+            chorale = Chorale.from_strings(*(names[voice_id] for voice_id in ["soprano", "alto", "tenor", "bass"]))
+        except (KeyError, ValueError, AssertionError) as e:
+            return [reader.ChoraleRecord("<request>", 0, None, e)]
+        return [reader.ChoraleRecord("<request>", 0, chorale, None)]
+    if "codes" in payload:
+        try:
+            chorale = Chorale.from_codes(payload["codes"])
+        except (TypeError, ValueError, IndexError, AssertionError) as e:
+            return [reader.ChoraleRecord("<request>", 0, None, e)]
+        return [reader.ChoraleRecord("<request>", 0, chorale, None)]
+    raise RequestError(400, "expected text, names or codes")
+
+
+def is_code(code):
+    """Returns whether a JSON value is a [midi, step] pair a compact Chorale can store
+    """
+    return (isinstance(code, list) and len(code) == 2
+            and all(type(value) is int and value in CODE_RANGE for value in code))
+
+
+def validate_payload(payload):
+    """Raises a RequestError with status 400 if the field of a payload read by payload_records
+    does not have the expected type, or gives a voice without notes
+    """
+    if "text" in payload:
+        if not isinstance(payload["text"], str):
+            raise RequestError(400, "text must be a string")
+    elif "names" in payload:
+        names = payload["names"]
+        if not (isinstance(names, dict) and all(isinstance(voice, list) and all(isinstance(name, str) for name in voice)
+                                                for voice in names.values())):
+            raise RequestError(400, "names must map voices to lists of note names")
+        if not all(names.values()):
+            raise RequestError(400, "names must give every voice at least one note")
+    elif "codes" in payload:
+        codes = payload["codes"]
+        if not (isinstance(codes, list) and all(isinstance(voice, list) and all(is_code(code) for code in voice)
+                                                for voice in codes)):
+            raise RequestError(400, "codes must be lists of [midi, step] pairs of 16-bit integers")
+        if not all(codes):
+            raise RequestError(400, "codes must give every voice at least one note")
+
+
+def check_payload(payload):
+    """Checks every chorale of a request payload and returns the list of results
+    """
+    from batch import check_record
+    return [check_record(record) for record in payload_records(payload)]
+
+
+class Server:
+    def __init__(self, workers=None, max_pending=None, timeout=10.0):
+        self.workers = workers or os.cpu_count()
+        self.max_pending = max_pending or 4 * self.workers
+        self.timeout = timeout
+        self.pool = None
+        self.pending = 0
+        self.counters = {"requests": 0, "checked": 0, "rejected": 0, "timeouts": 0, "errors": 0}
+        self.started = time.time()
+
+    def start_pool(self):
+        self.pool = ProcessPoolExecutor(self.workers, initializer=warm_up)
+        # start every worker now rather than on the first requests
+        for future in [self.pool.submit(os.getpid) for _ in range(self.workers)]:
+            future.result()
+
+    async def check(self, payload):
+        """Runs check_payload on the pool, applying backpressure and the timeout
+        """
+        if self.pending >= self.max_pending:
+            self.counters["rejected"] += 1
+            raise RequestError(503, "too many pending checks")
+        self.pending += 1
+        future = asyncio.get_running_loop().run_in_executor(self.pool, check_payload, payload)
+        # a timed out check keeps its worker busy, so it stays pending until it is over
+        future.add_done_callback(self.release)
+        try:
+            results = await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError:
+            self.counters["timeouts"] += 1
+            raise RequestError(504, "check timed out after %g seconds" % self.timeout)
+        self.counters["checked"] += len(results)
+        return {"results": results}
+
+    def release(self, future):
+        self.pending -= 1
+        if not future.cancelled():
+            future.exception()  # retrieved here when nobody awaits it after a timeout
+
+    def health(self):
+        return dict(self.counters, ok=True, pending=self.pending, workers=self.workers,
+                    max_pending=self.max_pending, uptime=time.time() - self.started)
+
+    async def respond(self, method, path, headers, body):
+        """Returns the status and the JSON object answering a request
+        """
+        if path == "/health":
+            return 200, self.health()
+        if path != "/check":
+            raise RequestError(404, "unknown path %s" % path)
+        if method != "POST":
+            raise RequestError(405, "use POST")
+
+        if headers.get("content-type", "").startswith("text/plain"):
+            payload = {"text": body}
+        else:
+            try:
+                payload = json.loads(body)
+            except ValueError as e:
+                raise RequestError(400, "invalid JSON: %s" % e)
+            if not isinstance(payload, dict):
+                raise RequestError(400, "expected a JSON object")
+            validate_payload(payload)
+        return 200, await self.check(payload)
+
+    async def handle(self, reader, writer):
+        """Serves the requests of one connection, keeping it open between requests
+        """
+        try:
+            while True:
+                request = await read_request(reader)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                self.counters["requests"] += 1
+                try:
+                    status, answer = await self.respond(method, path, headers, body)
+                except RequestError as e:
+                    status, answer = e.status, {"error": e.message}
+                except Exception as e:
+                    self.counters["errors"] += 1
+                    status, answer = 500, {"error": "%s: %s" % (type(e).__name__, e)}
+                keep_alive = headers.get("connection", "").lower() != "close"
+                write_response(writer, status, answer, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except RequestError as e:
+            write_response(writer, e.status, {"error": e.message}, False)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def close(self):
+        if self.pool:
+            self.pool.shutdown(cancel_futures=True)
+
+
+async def read_request(reader):
+    """Returns (method, path, headers, body) of the next request of a connection,
+    or None once the client closes it
+    """
+    line = await reader.readline()
+    if not line.strip():
+        return None
+    try:
+        method, path, _ = line.decode("latin-1").split()
+    except ValueError:
+        raise RequestError(400, "malformed request line")
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    length = headers.get("content-length", "") or "0"
+    # int() would also take signs, spaces and underscores
+    if not (length.isascii() and length.isdigit()):
+        raise RequestError(400, "invalid Content-Length %r" % length)
+    length = int(length)
+    if length > MAX_BODY:
+        raise RequestError(413, "body larger than %d bytes" % MAX_BODY)
+    body = await reader.readexactly(length) if length else b""
+    return method, path.split("?")[0], headers, body.decode("utf-8", "replace")
+
+
+def write_response(writer, status, answer, keep_alive=True):
+    body = json.dumps(answer).encode("utf-8")
+    head = ["HTTP/1.1 %d %s" % (status, REASONS.get(status, "Error")),
+            "Content-Type: application/json",
+            "Content-Length: %d" % len(body),
+            "Connection: %s" % ("keep-alive" if keep_alive else "close")]
+    if status == 503:
+        head.append("Retry-After: 1")
+    writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+
+
+async def serve(server, host="127.0.0.1", port=8765, unix=None):
+    if unix:
+        listener = await asyncio.start_unix_server(server.handle, unix)
+        where = unix
+    else:
+        listener = await asyncio.start_server(server.handle, host, port)
+        where = "http://%s:%d" % (host, port)
+    print("Serving on %s with %d workers" % (where, server.workers), file=sys.stderr)
+    async with listener:
+        await listener.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve chorale checks over HTTP")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default: 127.0.0.1)")
+    parser.add_argument("-p", "--port", type=int, default=8765, help="port to listen on (default: 8765)")
+    parser.add_argument("--unix", help="Unix socket path to listen on instead of a port")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count(),
+                        help="number of worker processes (default: number of cores)")
+    parser.add_argument("--max-pending", type=int,
+                        help="checks queued or running before requests are rejected (default: 4 per worker)")
+    parser.add_argument("-t", "--timeout", type=float, default=10.0, help="seconds allowed per request")
+    args = parser.parse_args(argv)
+
+    server = Server(args.workers, args.max_pending, args.timeout)
+    server.start_pool()
+    try:
+        asyncio.run(serve(server, args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,14 +1,25 @@
-from music21 import note, stream, chord, roman, pitch
 import voice_leading.error_checks
 import harmony.error_checks
+import harmony.helpers
+import voice_leading.report
+from analysis import reader
+from analysis.chorale import Chorale
+from analysis.context import AnalysisContext, get_context
+from analysis.incremental import IncrementalChecker
+from voice_leading.pitches import encode_note
 
 
 def live_check_chorale(chorale=None):
     """Checks chorale from user input chord by chord.
+    Each new chord only re-evaluates the rules it can affect, and prints the errors it reveals.
     """
+    from music21 import pitch, stream
     print("Input notes as instructed or enter 0 to exit")
+    checker = IncrementalChecker()
     if chorale:
         parts = [chorale.getElementById(p) for p in ["soprano", "alto", "tenor", "bass"]]
+        for codes in get_context(chorale).slices:
+            checker.add(codes)
     else:
         parts = []
         for p in ["soprano", "alto", "tenor", "bass"]:
@@ -16,7 +27,7 @@ def live_check_chorale(chorale=None):
             part.id = p
             parts.append(part)
         chorale = stream.Score(parts)
-    i = 0
+    i = len(checker.slices)
     while True:
         print("Enter chord #" + str(i))
         try:
@@ -28,12 +39,21 @@ def live_check_chorale(chorale=None):
             note.offset = i
             part.append(note)
 
-        check_chorale_errors(chorale)
+        for violation in checker.add([encode_note(n) for n in reversed(notes)]):
+            print(format_violation(violation))
         i += 1
 
 
+def format_violation(violation):
+    """Returns the line the checkers print for a voice leading or harmony violation
+    """
+    if violation.rule in harmony.error_checks.RULES:
+        return harmony.error_checks.format_violation(violation)
+    return voice_leading.report.format_violation(violation)
+
 
 def write_chorale(length):
+    from music21 import stream
     print("Enter soprano notes:")
     soprano = write_part(length)
     soprano.id = "soprano"
@@ -51,12 +71,14 @@ def write_chorale(length):
 
 
 def get_note(message=None):
+    from music21 import note
     if message:
         print(message)
     return note.Note(input())
 
 
 def write_part(length):
+    from music21 import note, stream
     part = stream.Part()
     for i in range(length):
         n = note.Note(input())
@@ -66,27 +88,79 @@ def write_part(length):
 
 
 def check_chorale_errors(chorale):
-    voice_leading.error_checks.check_chorale(chorale, False)
-    harmony.error_checks.check_chorale(chorale, False)
+    context = get_context(chorale)
+    voice_leading.error_checks.check_chorale(context, False)
+    harmony.error_checks.check_chorale(context, False)
+
+
+def recheck_chorale_errors(chorale, previous=None):
+    """Prints the errors of a chorale, re-checking only what changed since previous, the result
+    returned for an earlier version of it, and returns the analysis.edits.CheckedChorale
+    """
+    from analysis.edits import CheckedChorale
+    checked = previous.recheck(chorale) if previous is not None else CheckedChorale(chorale)
+    for violation in checked.violations():
+        print(format_violation(violation))
+    return checked
+
+
+def violation_to_dict(violation):
+    return {"rule": violation.rule, "voices": list(violation.voices), "index": violation.index}
+
+
+def chorale_results(chorale, cache=None, key_window=None):
+    """Returns the key, length and violations of a chorale, a music21 score or a compact Chorale,
+    as a JSON serializable dict. With an analysis.cache.ResultCache, a chorale checked before
+    under the same rules is not checked again. key_window gives every slice the key of the
+    window of that many slices around it, as in analysis.context.AnalysisContext.
+
+    >>> result = chorale_results(make_compact_chorale_from_strings(['C5', 'D5'], ['F4', 'G4'],
+    ...                                                            ['A3', 'B3'], ['F3', 'G3']))
+    >>> result["length"], result["violations"][0]
+    (2, {'rule': 'parallel_fifths', 'voices': ['bass', 'soprano'], 'index': 1})
+    >>> chorale_results(make_compact_chorale_from_strings([], [], [], []))
+    {'key': None, 'length': 0, 'violations': []}
+    """
+    from analysis.cache import content_key
+    from voice_leading import pipeline
+    if cache is not None:
+        key = content_key(chorale, key_window)
+        result = cache.get_key(key)
+        if result is not None:
+            return result
+
+    context = AnalysisContext(chorale, key_window=key_window)
+    if context.compact is not None and context.estimated_key is None:
+        # a chorale without notes has no key, so only the rules that need none are run
+        checker = pipeline.Checker(None, pipeline.make_key_free_rules())
+        for codes in context.slices:
+            checker.feed(codes)
+        violations = checker.finish()
+        chorale_key = None
+    else:
+        violations = pipeline.report_chorale(context) + harmony.error_checks.report_chorale(context)
+        chorale_key = str(context.key)
+    result = {"key": chorale_key, "length": len(context.slices),
+              "violations": [violation_to_dict(v) for v in violations]}
+    if cache is not None:
+        cache.put_key(key, result)
+    return result
 
 
 def get_chords(chorale):
-    chorale_key = chorale.analyze("key")
-    chord_list = filter(lambda x: type(x) is chord.Chord, chorale.chordify().recurse())
-    return list(chord_list)
+    return harmony.helpers.get_chords(chorale)
 
 
 def print_chords(chorale):
-    chorale_key = chorale.analyze("key")
-    chord_list = get_chords(chorale)
-    for c in chord_list:
-        rn = roman.romanNumeralFromChord(c, chorale_key)
-        print(rn.figure)
+    context = get_context(chorale)
+    for c in context.chords:
+        print(harmony.helpers.get_chord_label(c, context.key))
 
 
 def make_chorale(soprano, alto, tenor, bass):
     """Given 4 voices, constructs a chorale
     """
+    from music21 import stream
     soprano.id = "soprano"
     alto.id = "alto"
     tenor.id = "tenor"
@@ -98,6 +172,7 @@ def make_chorale(soprano, alto, tenor, bass):
 def make_chorale_from_strings(soprano, alto, tenor, bass):
     """Constructs a chorale given string lists of notes
     """
+    from music21 import note
     assert len(soprano) == len(alto) == len(tenor) == len(bass), "Voices must have same length"
 
     soprano = make_part(map(note.Note, soprano))
@@ -111,6 +186,7 @@ def make_chorale_from_strings(soprano, alto, tenor, bass):
 def make_part(lst):
     """Given a list of notes, constructs a voice from them
     """
+    from music21 import stream
     part = stream.Part()
     for i, n in enumerate(lst):
         n.offset = i
@@ -118,14 +194,29 @@ def make_part(lst):
     return part
 
 
+def make_compact_chorale_from_strings(soprano, alto, tenor, bass):
+    """Constructs a compact chorale given string lists of notes, without music21 notes
+    """
+    return Chorale.from_strings(soprano, alto, tenor, bass)
+
+
+def read_compact_chorale(filename):
+    """Reads the first chorale from a given file into a compact chorale
+    """
+    for record in reader.read_file(filename):
+        if record.error:
+            raise record.error
+        return record.chorale
+    raise reader.ChoraleSyntaxError(filename, 1, 1, "no chorale found")
+
+
 def read_chorale(filename):
     """Reads a chorale from a given file
     """
-    f = open(filename)
-
-    s = f.readline().split()
-    a = f.readline().split()
-    t = f.readline().split()
-    b = f.readline().split()
+    with open(filename) as f:
+        s = f.readline().split()
+        a = f.readline().split()
+        t = f.readline().split()
+        b = f.readline().split()
 
     return make_chorale_from_strings(s, a, t, b)
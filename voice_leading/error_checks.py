@@ -1,16 +1,17 @@
-from music21 import interval, chord
+from analysis.context import get_context
 from .errors import *
-from . import helpers
+from . import helpers, pitches, sonority
 
 
-def check_chorale(chorale, print_result=True):
+def check_chorale(chorale, print_result=True, vectorized=False):
+    """Prints every error found in the chorale, which may also be an AnalysisContext.
+    If vectorized is set, parallel motion between all voice pairs is checked in one NumPy pass.
+    """
     num_errors = 0
-    soprano = chorale.getElementById("soprano")
-    alto = chorale.getElementById("alto")
-    tenor = chorale.getElementById("tenor")
-    bass = chorale.getElementById("bass")
-    voices = [bass, tenor, alto, soprano]
-    chorale_key = chorale.analyze("key")
+    context = get_context(chorale)
+    voices = context.code_voices
+    bass, tenor, alto, soprano = voices
+    chorale_key = context.leading_tones
 
     for voice in voices:
         try:
@@ -44,6 +45,12 @@ def check_chorale(chorale, print_result=True):
             num_errors += 1
             print("%s & %s:" % (pair[0].id, pair[1].id), e.message)
 
+    if vectorized:
+        num_errors += check_parallels_vectorized(voices)
+        if print_result:
+            print("Check completed\n Result: %d errors" % num_errors)
+        return
+
     from itertools import combinations
 
     for pair in combinations(voices, 2):
@@ -56,7 +63,7 @@ def check_chorale(chorale, print_result=True):
 
     try:
         check_parallel_fourths(bass, soprano)
-    except ParallelFourthsError:
+    except ParallelFourthsError as e:
         num_errors += 1
         print("%s & %s:" % (bass.id, soprano.id), e.message)
 
@@ -64,6 +71,31 @@ def check_chorale(chorale, print_result=True):
             print("Check completed\n Result: %d errors" % num_errors)
 
 
+def check_parallels_vectorized(voices):
+    """Prints the parallel fifths, octaves and fourths check_chorale looks for,
+    computed for all voice pairs at once. Returns the number of errors found.
+    """
+    from itertools import combinations
+    from . import vectorized
+
+    num_errors = 0
+    motion = vectorized.find_motion(voices)
+    for lower, upper in combinations(range(len(voices)), 2):
+        for rule, error in [("parallel_fifths", ParallelFifthsError),
+                            ("parallel_octaves", ParallelOctavesError)]:
+            index = vectorized.first_violation(motion, rule, lower, upper)
+            if index is not None:
+                num_errors += 1
+                print("%s & %s:" % (voices[lower].id, voices[upper].id), error(index).message)
+                break
+
+    index = vectorized.first_violation(motion, "parallel_fourths", 0, len(voices) - 1)
+    if index is not None:
+        num_errors += 1
+        print("%s & %s:" % (voices[0].id, voices[-1].id), ParallelFourthsError(index).message)
+    return num_errors
+
+
 def check_augmented_seconds(voice):
     """Raises an error if the interval between two notes in a voice
     is an augmented second.
@@ -77,12 +109,18 @@ def check_augmented_seconds(voice):
     errors.AugmentedSecondError: Found augmented second at index 2
     >>> check_augmented_seconds(bass)
     """
+    for i in find_augmented_seconds(voice):
+        raise AugmentedSecondError(i)
+
+
+def find_augmented_seconds(voice):
+    """Yields the index of every note reached by an augmented second.
+    """
     previous_note = None
     for i, current_note in enumerate(voice):
         if i > 0:
-            test_interval = interval.notesToInterval(previous_note, current_note)
-            if test_interval.name == "A2":
-                raise AugmentedSecondError(i)
+            if helpers.get_interval(previous_note, current_note).name == "A2":
+                yield i
         previous_note = current_note
 
 
@@ -98,39 +136,77 @@ def check_unresolved_leaps(voice):
     ...
     errors.UnresolvedLeapError: Found unresolved leap at index 2
     """
+    for i in find_unresolved_leaps(voice):
+        raise UnresolvedLeapError(i)
+
+
+def find_unresolved_leaps(voice):
+    """Yields the index of every note that fails to resolve the leap before it.
+    """
     previous_note, must_resolve = None, 0
     for i, current_note in enumerate(voice):
         if previous_note == current_note:
             pass
         elif must_resolve:
-            test_interval = interval.notesToGeneric(previous_note, current_note)
+            test_interval = helpers.get_interval(previous_note, current_note)
             if test_interval.directed != must_resolve:
-                raise UnresolvedLeapError(i)
+                yield i
             must_resolve = 0
         elif i > 0:
-            test_interval = interval.notesToGeneric(previous_note, current_note)
+            test_interval = helpers.get_interval(previous_note, current_note)
             if test_interval.undirected >= 4:
                 must_resolve = -2*test_interval.directed//test_interval.undirected
         previous_note = current_note
 
 
 def check_unresolved_leading_tones(voice, chorale_key):
-    for i, current_note in enumerate(voice):
-        if current_note.pitch == chorale_key.getLeadingTone() and not helpers.resolves(voice[i:], 2):
-            raise UnresolvedLeadingToneError(i)
+    for i in find_unresolved_leading_tones(voice, chorale_key):
+        raise UnresolvedLeadingToneError(i)
+
+
+def find_unresolved_leading_tones(voice, chorale_key):
+    """Yields the index of every leading tone that does not resolve up by step.
+    chorale_key is a music21 key, the (midi, step) code of its leading tone,
+    or a list of the leading tone codes of the key at every index.
+    """
+    resolution = helpers.ResolutionIndex(voice)
+    if type(chorale_key) is list:
+        for i, (code, leading_tone) in enumerate(zip(resolution.codes, chorale_key)):
+            if code == leading_tone and not resolution.resolves(i, 2):
+                yield i
+        return
+
+    # compare spellings, as a natural leading tone carries an explicit natural accidental
+    if type(chorale_key) is tuple:
+        leading_tone = chorale_key
+    else:
+        leading_tone = pitches.encode_pitch(chorale_key.getLeadingTone())
+    for i, code in enumerate(resolution.codes):
+        if code == leading_tone and not resolution.resolves(i, 2):
+            yield i
 
 
 def check_unresolved_sevenths(voices):
+    for i, voice_id in find_unresolved_sevenths(voices):
+        raise UnresolvedSeventhError(i, voice_id)
+
+
+def find_unresolved_sevenths(voices):
+    """Yields (index, voice id) for every chord seventh that does not resolve down by step.
+    """
     # TODO: check doubled sevenths
     if len(voices) < 2:
         return
 
-    for i in range(len(voices[0])):
-        current_chord = chord.Chord([voice[i] for voice in voices])
-        if current_chord.seventh:
-            for voice in voices:
-                if current_chord.seventh == voice[i].pitch and not helpers.resolves(voice[i:], -2):
-                    raise UnresolvedSeventhError(i, voice.id)
+    resolutions = [helpers.ResolutionIndex(voice) for voice in voices]
+    seventh_voices = sonority.find_sevenths([[code[1] for code in r.codes] for r in resolutions])
+    for i, seventh_voice in enumerate(seventh_voices):
+        if seventh_voice < 0:
+            continue
+        seventh = resolutions[seventh_voice].codes[i]
+        for voice, resolution in zip(voices, resolutions):
+            if resolution.codes[i] == seventh and not resolution.resolves(i, -2):
+                yield i, voice.id
 
 
 def check_spacing(lower_voice, upper_voice):
@@ -146,9 +222,16 @@ def check_spacing(lower_voice, upper_voice):
     ...
     errors.SpacingError: Found spacing error at index 1
     """
+    for i in find_spacing_errors(lower_voice, upper_voice):
+        raise SpacingError(i)
+
+
+def find_spacing_errors(lower_voice, upper_voice):
+    """Yields every index where two voices are more than an octave apart.
+    """
     for i, (lower_note, upper_note) in enumerate(zip(lower_voice, upper_voice)):
-            if interval.notesToGeneric(lower_note, upper_note).undirected > 8:
-                raise SpacingError(i)
+        if helpers.get_interval(lower_note, upper_note).undirected > 8:
+            yield i
 
 def check_voice_crossing(lower_voice, upper_voice):
     """Raises an error if two voices intersect.
@@ -163,9 +246,16 @@ def check_voice_crossing(lower_voice, upper_voice):
     errors.VoiceCrossingError: Found voice crossing at index 2
     >>> check_voice_crossing(tenor, soprano)
     """
+    for i in find_voice_crossings(lower_voice, upper_voice):
+        raise VoiceCrossingError(i)
+
+
+def find_voice_crossings(lower_voice, upper_voice):
+    """Yields every index where the lower voice is above the upper voice.
+    """
     for i, (lower_note, upper_note) in enumerate(zip(lower_voice, upper_voice)):
         if not helpers.is_lower_note(lower_note, upper_note):
-            raise VoiceCrossingError(i)
+            yield i
 
 
 def check_voice_overlapping(lower_voice, upper_voice):
@@ -181,15 +271,21 @@ def check_voice_overlapping(lower_voice, upper_voice):
     errors.VoiceOverlappingError: Found voice overlapping at index 1
     >>> check_voice_overlapping(tenor, alto)
     """
+    for i in find_voice_overlaps(lower_voice, upper_voice):
+        raise VoiceOverlappingError(i)
+
+
+def find_voice_overlaps(lower_voice, upper_voice):
+    """Yields every index where the lower voice moves above the previous note of the upper voice.
+    """
     if len(lower_voice) < 2:
-        return False
-
-    previous_lower_note, previous_upper_note = lower_voice.notes[0], upper_voice.notes[0]
-    for i, (lower_note, upper_note) in enumerate(zip(lower_voice.notes[1:], upper_voice.notes[1:])):
-        if not helpers.is_lower_note(previous_lower_note, previous_upper_note):
-            raise VoiceOverlappingError(i + 1)
-        if not helpers.is_lower_note(lower_note, previous_upper_note):
-            raise VoiceOverlappingError(i + 1)
+        return
+
+    previous_lower_note, previous_upper_note = None, None
+    for i, (lower_note, upper_note) in enumerate(zip(lower_voice, upper_voice)):
+        if i > 0 and (not helpers.is_lower_note(previous_lower_note, previous_upper_note) or
+                      not helpers.is_lower_note(lower_note, previous_upper_note)):
+            yield i
         previous_lower_note, previous_upper_note = lower_note, upper_note
 
 
@@ -206,11 +302,18 @@ def check_parallel_fourths(bass, upper_voice):
     errors.ParallelFourthsError: Found parallel fourths at index 1
     >>> check_parallel_fourths(bass, soprano)
     """
+    for i in find_parallel_fourths(bass, upper_voice):
+        raise ParallelFourthsError(i)
+
+
+def find_parallel_fourths(bass, upper_voice):
+    """Yields every index reached by parallel fourths.
+    """
     was_fourth = False
     for i, (lower_note, upper_note) in enumerate(zip(bass, upper_voice)):
         current_fourth = helpers.is_fourth(lower_note, upper_note)
-        if current_fourth and was_fourth and lower_note.pitch != bass[i-1].pitch:
-            raise ParallelFourthsError(i)
+        if current_fourth and was_fourth and pitches.as_code(lower_note) != pitches.as_code(bass[i-1]):
+            yield i
         was_fourth = current_fourth
 
 
@@ -228,12 +331,19 @@ def check_parallel_fifths(lower_voice, upper_voice):
     errors.ParallelFifthsError: Found parallel fifths at index 2
     >>> check_parallel_fifths(bass, alto)
     """
+    for i in find_parallel_fifths(lower_voice, upper_voice):
+        raise ParallelFifthsError(i)
+
+
+def find_parallel_fifths(lower_voice, upper_voice):
+    """Yields every index reached by parallel fifths.
+    """
     # TODO: might want to rename p5 -> fifth
     was_p5 = False
     for i, (lower_note, upper_note) in enumerate(zip(lower_voice, upper_voice)):
         is_p5 = helpers.is_perfect_fifth(lower_note, upper_note)
-        if is_p5 and was_p5 and lower_note.pitch != lower_voice[i-1].pitch:
-            raise ParallelFifthsError(i)
+        if is_p5 and was_p5 and pitches.as_code(lower_note) != pitches.as_code(lower_voice[i-1]):
+            yield i
         was_p5 = is_p5
 
 
@@ -251,11 +361,18 @@ def check_parallel_octaves(lower_voice, upper_voice):
     errors.ParallelOctavesError: Found parallel octaves at index 2
     >>> check_parallel_octaves(bass, alto)
     """
+    for i in find_parallel_octaves(lower_voice, upper_voice):
+        raise ParallelOctavesError(i)
+
+
+def find_parallel_octaves(lower_voice, upper_voice):
+    """Yields every index reached by parallel octaves.
+    """
     was_p8 = False
     for i, (lower_note, upper_note) in enumerate(zip(lower_voice, upper_voice)):
         is_p8 = helpers.is_perfect_octave(lower_note, upper_note)
-        if is_p8 and was_p8 and lower_note.pitch != lower_voice[i-1].pitch:
-            raise ParallelOctavesError(i)
+        if is_p8 and was_p8 and pitches.as_code(lower_note) != pitches.as_code(lower_voice[i-1]):
+            yield i
         was_p8 = is_p8
 
 
@@ -271,16 +388,23 @@ def check_direct_fifths(bass, soprano):
     >>> soprano = stream.Part(map(note.Note, ['C5', 'D5', 'E5']))
     >>> check_direct_fifths(bass, soprano)
     """
+    for i in find_direct_fifths(bass, soprano):
+        raise DirectFifthsError(i)
+
+
+def find_direct_fifths(bass, soprano):
+    """Yields every index reached by a fifth in similar motion with a leap in the soprano.
+    """
     if len(soprano) <= 1:
         return
 
     for i, (bass_note, soprano_note) in enumerate(zip(bass, soprano)):
         is_p5 = helpers.is_perfect_fifth(bass_note, soprano_note)
         if is_p5 and i > 0:
-            bass_interval = interval.notesToGeneric(bass[i-1], bass_note).directed
-            soprano_interval = interval.notesToGeneric(soprano[i-1], soprano_note).directed
+            bass_interval = helpers.get_interval(bass[i-1], bass_note).directed
+            soprano_interval = helpers.get_interval(soprano[i-1], soprano_note).directed
             if soprano_interval * bass_interval > 0 and abs(soprano_interval) > 2:
-                raise DirectFifthsError(i)
+                yield i
 
 
 def check_direct_octaves(bass, soprano):
@@ -296,12 +420,19 @@ def check_direct_octaves(bass, soprano):
     ...
     errors.DirectOctavesError: Found direct octave at index 2
     """
+    for i in find_direct_octaves(bass, soprano):
+        raise DirectOctavesError(i)
+
+
+def find_direct_octaves(bass, soprano):
+    """Yields every index reached by an octave in similar motion with a leap in the soprano.
+    """
     if len(bass) <= 1:
         return
     for i, (bass_note, soprano_note) in enumerate(zip(bass, soprano)):
         is_p8 = helpers.is_perfect_octave(bass_note, soprano_note)
         if is_p8 and i > 0:
-            bass_interval = interval.notesToGeneric(bass[i-1], bass_note).directed
-            soprano_interval = interval.notesToGeneric(soprano[i-1], soprano_note).directed
+            bass_interval = helpers.get_interval(bass[i-1], bass_note).directed
+            soprano_interval = helpers.get_interval(soprano[i-1], soprano_note).directed
             if soprano_interval * bass_interval > 0 and abs(soprano_interval) > 2:
-                raise DirectOctavesError(i)
+                yield i
@@ -1,4 +1,81 @@
-from music21 import interval
+from collections import OrderedDict
+
+from .pitches import as_code, generic_directed, interval_info
+
+
+class IntervalCache:
+    """Bounded LRU cache of the interval facts the checks need, keyed by the (midi, step)
+    codes of the two pitches. Entries hold no reference to the notes they came from.
+
+    >>> from music21 import note
+    >>> cache = IntervalCache(maxsize=2)
+    >>> cache.get(note.Note('C4'), note.Note('G4')).simple_name
+    'P5'
+    >>> cache.get(note.Note('C4'), note.Note('G4')).directed
+    5
+    >>> cache.hits, cache.misses
+    (1, 1)
+    >>> cache.resize(0)
+    >>> len(cache)
+    0
+    """
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, first_note, second_note):
+        """Returns the IntervalInfo from the first note to the second note,
+        which may be music21 notes or (midi, step) codes
+        """
+        key = (as_code(first_note), as_code(second_note))
+        info = self.entries.get(key)
+        if info is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return info
+
+        self.misses += 1
+        info = interval_info(*key)
+        if self.maxsize > 0:
+            self.entries[key] = info
+            if len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        return info
+
+    def clear(self):
+        """Empties the cache and resets its counters
+        """
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def resize(self, maxsize):
+        """Sets the maximum number of entries, evicting the least recently used ones
+        """
+        self.maxsize = maxsize
+        while len(self.entries) > max(maxsize, 0):
+            self.entries.popitem(last=False)
+
+    def stats(self):
+        """Returns a dict of the size and the hit and miss counters of the cache
+        """
+        lookups = self.hits + self.misses
+        return {"size": len(self.entries), "maxsize": self.maxsize, "hits": self.hits,
+                "misses": self.misses, "hit_rate": self.hits / lookups if lookups else 0.0}
+
+
+interval_cache = IntervalCache()
+
+
+def get_interval(first_note, second_note):
+    """Returns the cached IntervalInfo from the first note to the second note
+    """
+    return interval_cache.get(first_note, second_note)
 
 
 def is_lower_note(expected_lower, expected_upper):
@@ -10,7 +87,7 @@ def is_lower_note(expected_lower, expected_upper):
     >>> is_lower_note(note.Note('C3'), note.Note('B2'))
     False
     """
-    return interval.getAbsoluteLowerNote(expected_lower, expected_upper) is expected_lower
+    return get_interval(expected_lower, expected_upper).semitones >= 0
 
 
 def resolves(voice, resolve_interval):
@@ -30,17 +107,57 @@ def resolves(voice, resolve_interval):
 
     first_note = voice[0]
     for note in voice[1:]:
-        current_interval = interval.notesToInterval(first_note, note)
-        if current_interval.generic.directed == resolve_interval:
+        current_interval = get_interval(first_note, note)
+        if current_interval.directed == resolve_interval:
             return True
         # returns false if the resolve interval is wrong or there a chromatic step in the wrong direction
-        if current_interval.generic.directed != 1 or resolve_interval * current_interval.chromatic.directed < 0:
+        if current_interval.directed != 1 or resolve_interval * current_interval.semitones < 0:
             return
 
     return True
 
 
 
+def next_different_pitches(codes):
+    """Returns for every index of a list of (midi, step) codes the index of the next code
+    that differs from it, or len(codes), computed in one backward pass.
+
+    >>> next_different_pitches([(65, 32), (65, 32), (64, 31), (64, 31)])
+    [2, 2, 4, 4]
+    """
+    result = [len(codes)] * len(codes)
+    for i in range(len(codes) - 2, -1, -1):
+        result[i] = i + 1 if codes[i + 1] != codes[i] else result[i + 1]
+    return result
+
+
+class ResolutionIndex:
+    """Answers resolves(voice[index:], resolve_interval) for any index of a voice
+    without slicing it, by jumping over repeated notes with a next different pitch index.
+
+    >>> index = ResolutionIndex([(65, 32), (65, 32), (64, 31), (65, 32)])
+    >>> index.resolves(0, -2), index.resolves(0, 2), index.resolves(3, 2)
+    (True, False, True)
+    """
+    def __init__(self, voice):
+        self.codes = [as_code(n) for n in voice]
+        self.next_different = next_different_pitches(self.codes)
+
+    def resolves(self, index, resolve_interval):
+        codes = self.codes
+        midi, step = codes[index]
+        j = self.next_different[index]
+        # only chromatic alterations in the resolving direction are stepped over one by one
+        while j < len(codes):
+            directed = generic_directed(codes[j][1] - step)
+            if directed == resolve_interval:
+                return True
+            if directed != 1 or resolve_interval * (codes[j][0] - midi) < 0:
+                return False
+            j = self.next_different[j]
+        return True
+
+
 def is_fourth(lower_note, upper_note):
     """Returns whether the interval between two given notes reduced to an octave is a is_fourth.
 
@@ -53,8 +170,7 @@ def is_fourth(lower_note, upper_note):
     >>> is_fourth(c4, g4)
     False
     """
-    test_interval = interval.notesToGeneric(lower_note, upper_note)
-    if test_interval.simpleUndirected == 4:
+    if get_interval(lower_note, upper_note).simple_undirected == 4:
         return True
     return False
 
@@ -73,8 +189,7 @@ def is_perfect_fifth(lower_note, upper_note):
     >>> is_perfect_fifth(g4, g7)
     False
     """
-    test_interval = interval.Interval(lower_note, upper_note)
-    if test_interval.simpleName == "P5":
+    if get_interval(lower_note, upper_note).simple_name == "P5":
         return True
     return False
 
@@ -95,7 +210,6 @@ def is_perfect_octave(lower_note, upper_note):
     False
     """
 
-    test_interval = interval.Interval(lower_note, upper_note)
-    if test_interval.semiSimpleName == "P8":
+    if get_interval(lower_note, upper_note).semi_simple_name == "P8":
         return True
     return False
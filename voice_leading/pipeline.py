@@ -0,0 +1,306 @@
+"""Fused voice leading checker stepping through a chorale one vertical slice at a time.
+
+A slice is a tuple of (midi, step) codes ordered from the bass up. Every rule
+keeps the little state it needs between slices, so a single traversal of the
+chorale evaluates all of them. The violations match report.report_chorale.
+"""
+from itertools import combinations
+
+from . import pitches, sonority
+from .report import Violation, VOICE_IDS, sort_violations
+
+BASS, TENOR, ALTO, SOPRANO = range(4)
+
+
+class Rule:
+    """Base class of the rules run by the Checker.
+    Subclasses set rule and override step, and finish if they hold pending notes.
+    """
+    rule = None
+
+    def __init__(self, *voices):
+        self.voices = voices
+        self.voice_ids = tuple(VOICE_IDS[v] for v in voices)
+
+    def step(self, index, codes, out):
+        """Appends to out the violations decided by the slice at index
+        """
+        raise NotImplementedError
+
+    def finish(self, out):
+        """Appends to out the violations decided at the end of the chorale
+        """
+        pass
+
+    def emit(self, out, index, voice_ids=None):
+        out.append(Violation(self.rule, voice_ids or self.voice_ids, index))
+
+
+class AugmentedSecondRule(Rule):
+    rule = "augmented_second"
+
+    def __init__(self, voice):
+        Rule.__init__(self, voice)
+        self.previous = None
+
+    def step(self, index, codes, out):
+        current = codes[self.voices[0]]
+        if self.previous is not None and pitches.is_augmented_second(self.previous, current):
+            self.emit(out, index)
+        self.previous = current
+
+
+class UnresolvedLeapRule(Rule):
+    rule = "unresolved_leap"
+
+    def __init__(self, voice):
+        Rule.__init__(self, voice)
+        self.previous, self.must_resolve = None, 0
+
+    def step(self, index, codes, out):
+        current = codes[self.voices[0]]
+        previous = self.previous
+        self.previous = current
+        if previous is None or previous == current:
+            return
+        directed = pitches.generic_directed(current[1] - previous[1])
+        if self.must_resolve:
+            if directed != self.must_resolve:
+                self.emit(out, index)
+            self.must_resolve = 0
+        elif abs(directed) >= 4:
+            self.must_resolve = -2 if directed > 0 else 2
+
+
+class ResolutionRule(Rule):
+    """Notes marked by subclasses must move by resolve_interval before moving any other way.
+    A note is pending while the voice repeats it or alters it chromatically in the resolving direction.
+    """
+    resolve_interval = None
+
+    def __init__(self, *voices):
+        Rule.__init__(self, *voices)
+        self.pending = []
+
+    def resolve(self, index, codes, out):
+        """Settles the pending notes against the slice at index
+        """
+        still_pending = []
+        for start, voice, first in self.pending:
+            current = codes[voice]
+            directed = pitches.generic_directed(current[1] - first[1])
+            if directed == self.resolve_interval:
+                continue
+            if directed != 1 or self.resolve_interval * (current[0] - first[0]) < 0:
+                self.emit(out, start, (VOICE_IDS[voice],))
+                continue
+            still_pending.append((start, voice, first))
+        self.pending = still_pending
+
+    def finish(self, out):
+        # a note still pending at the end of the chorale counts as resolved
+        self.pending = []
+
+    def flush(self, out):
+        """Appends the notes still pending as unresolved, for a stream cut off before they resolve
+        """
+        for start, voice, first in self.pending:
+            self.emit(out, start, (VOICE_IDS[voice],))
+        self.pending = []
+
+
+class UnresolvedLeadingToneRule(ResolutionRule):
+    rule = "unresolved_leading_tone"
+    resolve_interval = 2
+
+    def __init__(self, leading_tone, *voices):
+        """leading_tone is the code of the leading tone, or a sequence of the leading tone of every slice
+        """
+        ResolutionRule.__init__(self, *voices)
+        self.leading_tone = leading_tone
+
+    def step(self, index, codes, out):
+        self.resolve(index, codes, out)
+        leading_tone = self.leading_tone if type(self.leading_tone) is tuple else self.leading_tone[index]
+        for voice in self.voices:
+            if codes[voice] == leading_tone:
+                self.pending.append((index, voice, codes[voice]))
+
+
+class UnresolvedSeventhRule(ResolutionRule):
+    rule = "unresolved_seventh"
+    resolve_interval = -2
+
+    def get_seventh(self, codes):
+        """Returns the code of the chord seventh of a slice or None
+        """
+        return sonority.seventh(codes)
+
+    def step(self, index, codes, out):
+        self.resolve(index, codes, out)
+        seventh = self.get_seventh(codes)
+        if seventh:
+            for voice in self.voices:
+                if codes[voice] == seventh:
+                    self.pending.append((index, voice, codes[voice]))
+
+
+class SpacingRule(Rule):
+    rule = "spacing"
+
+    def step(self, index, codes, out):
+        lower, upper = self.voices
+        if abs(codes[upper][1] - codes[lower][1]) > 7:
+            self.emit(out, index)
+
+
+class VoiceCrossingRule(Rule):
+    rule = "voice_crossing"
+
+    def step(self, index, codes, out):
+        lower, upper = self.voices
+        if codes[lower][0] > codes[upper][0]:
+            self.emit(out, index)
+
+
+class VoiceOverlappingRule(Rule):
+    rule = "voice_overlapping"
+
+    def __init__(self, lower, upper):
+        Rule.__init__(self, lower, upper)
+        self.previous = None
+
+    def step(self, index, codes, out):
+        lower, upper = self.voices
+        previous, self.previous = self.previous, codes
+        if previous is None:
+            return
+        if previous[lower][0] > previous[upper][0] or codes[lower][0] > previous[upper][0]:
+            self.emit(out, index)
+
+
+class ParallelRule(Rule):
+    """Flags two consecutive slices where is_interval holds for the voices and the lower voice moves.
+    """
+    is_interval = None
+
+    def __init__(self, lower, upper):
+        Rule.__init__(self, lower, upper)
+        self.was_interval, self.previous_lower = False, None
+
+    def step(self, index, codes, out):
+        lower, upper = codes[self.voices[0]], codes[self.voices[1]]
+        current = self.is_interval(lower, upper)
+        if current and self.was_interval and lower != self.previous_lower:
+            self.emit(out, index)
+        self.was_interval, self.previous_lower = current, lower
+
+
+class ParallelFifthsRule(ParallelRule):
+    rule = "parallel_fifths"
+    is_interval = staticmethod(pitches.is_perfect_fifth)
+
+
+class ParallelOctavesRule(ParallelRule):
+    rule = "parallel_octaves"
+    is_interval = staticmethod(pitches.is_perfect_octave)
+
+
+class ParallelFourthsRule(ParallelRule):
+    rule = "parallel_fourths"
+    is_interval = staticmethod(pitches.is_fourth)
+
+
+def make_key_free_rules():
+    """Returns fresh instances of the rules of report.report_chorale that do not depend on the key
+    """
+    voices = range(4)
+    rules = [AugmentedSecondRule(v) for v in voices]
+    rules += [UnresolvedLeapRule(v) for v in voices if v != BASS]
+    rules.append(UnresolvedSeventhRule(*voices))
+    rules += [SpacingRule(v, v + 1) for v in voices if BASS < v < SOPRANO]
+    rules += [VoiceCrossingRule(v, v + 1) for v in voices if v < SOPRANO]
+    rules += [VoiceOverlappingRule(v, v + 1) for v in voices if v < SOPRANO]
+    rules += [ParallelFifthsRule(*pair) for pair in combinations(voices, 2)]
+    rules += [ParallelOctavesRule(*pair) for pair in combinations(voices, 2)]
+    rules.append(ParallelFourthsRule(BASS, SOPRANO))
+    return rules
+
+
+def make_key_rules(leading_tone):
+    """Returns fresh instances of the rules that depend on the key, given the code of its leading tone
+    """
+    return [UnresolvedLeadingToneRule(leading_tone, BASS, SOPRANO)]
+
+
+def make_rules(leading_tone):
+    """Returns fresh instances of every rule run by report.report_chorale
+    """
+    return make_key_free_rules() + make_key_rules(leading_tone)
+
+
+class Checker:
+    def __init__(self, leading_tone, rules=None):
+        """leading_tone is the (midi, step) code of the leading tone of the chorale key,
+        or a list of the leading tone of every slice. rules replaces the rules of make_rules if given.
+        """
+        self.rules = rules if rules is not None else make_rules(leading_tone)
+        self.violations = []
+        self.index = 0
+
+    def feed(self, codes):
+        """Evaluates every rule on the next slice
+        """
+        for rule in self.rules:
+            rule.step(self.index, codes, self.violations)
+        self.index += 1
+
+    def finish(self):
+        """Settles the pending notes and returns every violation sorted by report.sort_violations
+        """
+        for rule in self.rules:
+            rule.finish(self.violations)
+        return sort_violations(self.violations)
+
+
+def get_slices(voices):
+    """Returns the slices of the voices, ordered from the bass up
+    """
+    encoded = [pitches.encode_voice(voice) for voice in voices]
+    return list(zip(*(list(zip(midi, steps)) for midi, steps in encoded)))
+
+
+def key_leading_tone(chorale_key):
+    """Returns the code of the leading tone of a music21 key
+    """
+    leading_tone = chorale_key.getLeadingTone()
+    return pitches.encode_pitch(leading_tone)
+
+
+def check_slices(slices, leading_tone):
+    """Runs every rule over an iterable of slices and returns the violations
+    """
+    checker = Checker(leading_tone)
+    for codes in slices:
+        checker.feed(codes)
+    return checker.finish()
+
+
+def report_chorale(chorale, chorale_key=None):
+    """Returns the same violations as report.report_chorale in a single pass over the slices.
+    The chorale may also be an AnalysisContext.
+
+    >>> import utils
+    >>> chorale = utils.make_chorale_from_strings(['C5', 'D5'], ['F4', 'G4'], ['A3', 'B3'], ['F3', 'G3'])
+    >>> for violation in report_chorale(chorale):
+    ...     print(violation)
+    Violation(rule='parallel_fifths', voices=('bass', 'soprano'), index=1)
+    Violation(rule='parallel_fifths', voices=('alto', 'soprano'), index=1)
+    Violation(rule='parallel_octaves', voices=('bass', 'alto'), index=1)
+    """
+    from analysis.context import get_context
+
+    context = get_context(chorale)
+    if chorale_key is None:
+        return check_slices(context.slices, context.leading_tones)
+    return check_slices(context.slices, key_leading_tone(chorale_key))
@@ -0,0 +1,228 @@
+"""Integer encodings of notes used by the array-based checks.
+
+A note is encoded as a (midi, step) pair: its MIDI number and its diatonic
+step number (music21's diatonicNoteNum). The pair identifies a spelled pitch,
+so every interval the checks need can be computed from differences of codes.
+Nothing here imports music21.
+"""
+from collections import namedtuple
+
+IntervalInfo = namedtuple("IntervalInfo", ["name", "simple_name", "semi_simple_name",
+                                           "directed", "undirected", "simple_undirected",
+                                           "semitones"])
+
+
+def encode_note(n):
+    """Returns the (midi, step) code of a music21 note.
+
+    >>> from music21 import note
+    >>> encode_note(note.Note('C4'))
+    (60, 29)
+    >>> encode_note(note.Note('B#3'))
+    (60, 28)
+    """
+    return encode_pitch(n.pitch)
+
+
+def encode_pitch(p):
+    """Returns the (midi, step) code of a music21 pitch. Unlike Pitch.midi,
+    the MIDI number is not folded back into the 0 to 127 range.
+    """
+    return int(round(p.ps)), p.diatonicNoteNum
+
+
+def as_code(n):
+    """Returns n if it is already a (midi, step) code, and the code of a music21 note otherwise
+    """
+    if type(n) is tuple:
+        return n
+    return encode_note(n)
+
+
+def encode_voice(voice):
+    """Returns the MIDI numbers and the diatonic steps of a voice as two lists.
+    The voice is a music21 part or a sequence of (midi, step) codes.
+    """
+    codes = [as_code(n) for n in getattr(voice, "notes", voice)]
+    return [code[0] for code in codes], [code[1] for code in codes]
+
+
+def generic_directed(step_difference):
+    """Returns the directed generic interval spanning a difference of diatonic steps,
+    following music21 in calling a unison 1.
+
+    >>> generic_directed(0)
+    1
+    >>> generic_directed(4)
+    5
+    >>> generic_directed(-1)
+    -2
+    """
+    if step_difference >= 0:
+        return step_difference + 1
+    return step_difference - 1
+
+
+def code_name(code):
+    """Returns the music21 name with octave of a (midi, step) code.
+
+    >>> code_name((61, 29))
+    'C#4'
+    >>> code_name((58, 28))
+    'B-3'
+    """
+    midi, step = code
+    octave, letter = divmod(step - 1, 7)
+    natural = 12 * (octave + 1) + [0, 2, 4, 5, 7, 9, 11][letter]
+    alteration = midi - natural
+    accidental = "#" * alteration if alteration > 0 else "-" * -alteration
+    return "CDEFGAB"[letter] + accidental + str(octave)
+
+
+# semitones of the perfect and of the major simple intervals
+PERFECT_SEMITONES = {1: 0, 4: 5, 5: 7}
+MAJOR_SEMITONES = {2: 2, 3: 4, 6: 9, 7: 11}
+
+
+def specifier(simple_undirected, semitones):
+    """Returns the music21 specifier of a simple generic interval spanning a number of semitones.
+
+    >>> specifier(5, 7), specifier(3, 3), specifier(2, 3), specifier(6, 7)
+    ('P', 'm', 'A', 'd')
+    """
+    if simple_undirected in PERFECT_SEMITONES:
+        offset = semitones - PERFECT_SEMITONES[simple_undirected]
+        if offset == 0:
+            return "P"
+        return "A" * offset if offset > 0 else "d" * -offset
+    offset = semitones - MAJOR_SEMITONES[simple_undirected]
+    if offset == 0:
+        return "M"
+    if offset == -1:
+        return "m"
+    return "A" * offset if offset > 0 else "d" * (-offset - 1)
+
+
+def interval_info(first, second):
+    """Returns the IntervalInfo from the first code to the second code, which holds
+    what music21's Interval reports for the two pitches.
+
+    >>> interval_info((60, 29), (79, 40))
+    IntervalInfo(name='P12', simple_name='P5', semi_simple_name='P5', directed=12, undirected=12, simple_undirected=5, semitones=19)
+    >>> interval_info((63, 30), (60, 29)).name
+    'A2'
+    >>> interval_info((48, 22), (72, 36)).semi_simple_name
+    'P8'
+    """
+    step_difference = second[1] - first[1]
+    semitones = second[0] - first[0]
+    undirected = abs(step_difference) + 1
+    # qualities are measured upwards from the lower pitch of the generic interval
+    upward = semitones if step_difference >= 0 else -semitones
+    octaves, simple = divmod(undirected - 1, 7)
+    simple += 1
+    quality = specifier(simple, upward - 12 * octaves)
+    if octaves and simple == 1:
+        semi_simple_name = specifier(1, upward - 12 * octaves) + "8"
+    else:
+        semi_simple_name = quality + str(simple)
+    return IntervalInfo(quality + str(undirected), quality + str(simple), semi_simple_name,
+                        generic_directed(step_difference), undirected, simple, semitones)
+
+
+def simple_semitones(lower, upper, octaves):
+    """Returns the semitones between two codes, measured in the direction of the
+    generic interval and reduced by the given number of octaves
+    """
+    step_difference = upper[1] - lower[1]
+    midi_difference = upper[0] - lower[0]
+    if step_difference < 0:
+        midi_difference = -midi_difference
+    return midi_difference - 12 * octaves
+
+
+def is_augmented_second(first, second):
+    """Returns whether two codes are an augmented second apart.
+
+    >>> is_augmented_second((63, 30), (60, 29))
+    True
+    >>> is_augmented_second((60, 29), (63, 31))
+    False
+    """
+    return abs(second[1] - first[1]) == 1 and simple_semitones(first, second, 0) == 3
+
+
+def is_fourth(lower, upper):
+    """Returns whether two codes reduce to a fourth of any quality
+    """
+    return abs(upper[1] - lower[1]) % 7 == 3
+
+
+def is_perfect_fifth(lower, upper):
+    """Returns whether two codes reduce to a perfect fifth.
+
+    >>> is_perfect_fifth((48, 22), (67, 33))
+    True
+    >>> is_perfect_fifth((59, 28), (65, 32))
+    False
+    """
+    generic = abs(upper[1] - lower[1])
+    return generic % 7 == 4 and simple_semitones(lower, upper, generic // 7) == 7
+
+
+def is_perfect_octave(lower, upper):
+    """Returns whether two codes are a perfect octave or a compound perfect octave apart
+    """
+    generic = abs(upper[1] - lower[1])
+    return generic > 0 and generic % 7 == 0 and simple_semitones(lower, upper, generic // 7 - 1) == 12
+
+
+LETTER_STEPS = {"c": 0, "d": 1, "e": 2, "f": 3, "g": 4, "a": 5, "b": 6}
+LETTER_SEMITONES = [0, 2, 4, 5, 7, 9, 11]
+ACCIDENTALS = {"": 0, "#": 1, "##": 2, "-": -1, "--": -2}
+
+
+def make_name_table(octaves=range(10)):
+    """Returns a dict mapping every note name the parser accepts, in both letter cases,
+    with and without an octave, to its (midi, step) code
+    """
+    table = {}
+    for letter, step in LETTER_STEPS.items():
+        for accidental, alteration in ACCIDENTALS.items():
+            for octave in octaves:
+                code = 12 * (octave + 1) + LETTER_SEMITONES[step] + alteration, 7 * octave + step + 1
+                for first in [letter, letter.upper()]:
+                    table[first + accidental + str(octave)] = code
+                    if octave == 4:
+                        table[first + accidental] = code
+    return table
+
+
+NAME_TABLE = make_name_table()
+
+
+def parse_name(name):
+    """Returns the (midi, step) code of a note name in music21 notation,
+    such as 'f#4' or 'B-3'. The octave defaults to 4 as in music21.
+
+    >>> parse_name('c4')
+    (60, 29)
+    >>> parse_name('B-3')
+    (58, 28)
+    >>> parse_name('e#')
+    (65, 31)
+    """
+    code = NAME_TABLE.get(name)
+    if code is not None:
+        return code
+
+    letter = name[:1].lower()
+    end = len(name)
+    while end > 1 and name[end - 1].isdigit():
+        end -= 1
+    accidental, octave = name[1:end], name[end:]
+    if letter not in LETTER_STEPS or accidental not in ACCIDENTALS or not octave:
+        raise ValueError("Invalid note name: %r" % name)
+    octave = int(octave)
+    step = LETTER_STEPS[letter]
+    return 12 * (octave + 1) + LETTER_SEMITONES[step] + ACCIDENTALS[accidental], 7 * octave + step + 1
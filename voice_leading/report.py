@@ -0,0 +1,119 @@
+"""Collects every voice leading error of a chorale as structured records.
+
+Unlike check_chorale, which stops each check at its first error and prints it,
+report_chorale scans each rule once and returns all of its violations.
+"""
+from collections import namedtuple
+from itertools import combinations
+
+from analysis.context import get_context
+from . import error_checks
+from .errors import *
+
+Violation = namedtuple("Violation", ["rule", "voices", "index"])
+Violation.__doc__ = """A broken rule: the rule name, the ids of the voices involved and the index of the error"""
+
+VOICE_IDS = ["bass", "tenor", "alto", "soprano"]
+
+RULES = ["augmented_second", "unresolved_leap", "unresolved_seventh", "unresolved_leading_tone",
+         "spacing", "voice_crossing", "voice_overlapping",
+         "parallel_fifths", "parallel_octaves", "parallel_fourths"]
+
+
+ERRORS = {"augmented_second": AugmentedSecondError,
+          "unresolved_leap": UnresolvedLeapError,
+          "unresolved_seventh": UnresolvedSeventhError,
+          "unresolved_leading_tone": UnresolvedLeadingToneError,
+          "spacing": SpacingError,
+          "voice_crossing": VoiceCrossingError,
+          "voice_overlapping": VoiceOverlappingError,
+          "parallel_fifths": ParallelFifthsError,
+          "parallel_octaves": ParallelOctavesError,
+          "parallel_fourths": ParallelFourthsError}
+
+
+def format_violation(violation):
+    """Returns the line check_chorale prints for a violation.
+
+    >>> format_violation(Violation("parallel_fifths", ("bass", "soprano"), 3))
+    'bass & soprano: Found parallel fifths at index 3'
+    """
+    message = ERRORS[violation.rule](violation.index).message
+    return "%s: %s" % (" & ".join(violation.voices), message)
+
+
+def get_voices(chorale):
+    """Returns the voices of a chorale from the lowest to the highest
+    """
+    return [chorale.getElementById(voice_id) for voice_id in VOICE_IDS]
+
+
+def report_chorale(chorale, chorale_key=None):
+    """Returns a list of every violation in the chorale sorted by sort_violations.
+    The chorale may also be an AnalysisContext.
+
+    >>> import utils
+    >>> chorale = utils.make_chorale_from_strings(['C5', 'D5'], ['F4', 'G4'], ['A3', 'B3'], ['F3', 'G3'])
+    >>> for violation in report_chorale(chorale):
+    ...     print(violation)
+    Violation(rule='parallel_fifths', voices=('bass', 'soprano'), index=1)
+    Violation(rule='parallel_fifths', voices=('alto', 'soprano'), index=1)
+    Violation(rule='parallel_octaves', voices=('bass', 'alto'), index=1)
+    """
+    context = get_context(chorale)
+    voices = context.code_voices
+    bass, soprano = voices[0], voices[-1]
+    if chorale_key is None:
+        chorale_key = context.leading_tones
+
+    result = []
+
+    def add(rule, voices, indices):
+        voice_ids = tuple(voice.id for voice in voices)
+        result.extend(Violation(rule, voice_ids, i) for i in indices)
+
+    for voice in voices:
+        add("augmented_second", [voice], error_checks.find_augmented_seconds(voice))
+    for voice in voices[1:]:
+        add("unresolved_leap", [voice], error_checks.find_unresolved_leaps(voice))
+    for i, voice_id in error_checks.find_unresolved_sevenths(voices):
+        result.append(Violation("unresolved_seventh", (voice_id,), i))
+    for voice in [bass, soprano]:
+        add("unresolved_leading_tone", [voice],
+            error_checks.find_unresolved_leading_tones(voice, chorale_key))
+
+    pairs = list(zip(voices[:-1], voices[1:]))
+    for pair in pairs[1:]:
+        add("spacing", pair, error_checks.find_spacing_errors(*pair))
+    for pair in pairs:
+        add("voice_crossing", pair, error_checks.find_voice_crossings(*pair))
+    for pair in pairs:
+        add("voice_overlapping", pair, error_checks.find_voice_overlaps(*pair))
+
+    for pair in combinations(voices, 2):
+        add("parallel_fifths", pair, error_checks.find_parallel_fifths(*pair))
+    for pair in combinations(voices, 2):
+        add("parallel_octaves", pair, error_checks.find_parallel_octaves(*pair))
+    add("parallel_fourths", [bass, soprano], error_checks.find_parallel_fourths(bass, soprano))
+
+    return sort_violations(result)
+
+
+def sort_violations(violations):
+    """Sorts violations by rule in the order of RULES, then by voices from the lowest, then by index
+    """
+    def key(violation):
+        rule = RULES.index(violation.rule) if violation.rule in RULES else len(RULES)
+        voices = [VOICE_IDS.index(v) if v in VOICE_IDS else len(VOICE_IDS) for v in violation.voices]
+        return rule, voices, violation.index
+
+    return sorted(violations, key=key)
+
+
+def count_by_rule(violations):
+    """Returns a dict mapping each rule to the number of times it was broken
+    """
+    counts = dict.fromkeys(RULES, 0)
+    for violation in violations:
+        counts[violation.rule] = counts.get(violation.rule, 0) + 1
+    return counts
@@ -0,0 +1,140 @@
+"""Chord roots, sevenths and qualities of slices from precomputed tables.
+
+music21 finds the root of a chord from the letter names of its pitches alone:
+a letter with every other letter stacked in thirds above it, or else the
+letter with the most weighted chord steps above it. The seventh is then the
+first note a seventh above the root. So ROOTS holds the root letter of each of
+the 128 sets of letters, and a slice only needs the letter mask of its codes
+and a scan of its voices.
+
+A slice's pitch-class mask, read relative to the root, gives its quality from
+QUALITIES. A whole chorale is analyzed with NumPy in one pass.
+"""
+from collections import namedtuple
+
+import numpy as np
+
+Sonority = namedtuple("Sonority", ["root", "seventh", "bass", "pitch_classes", "quality"])
+Sonority.__doc__ = """The root and seventh codes of a slice (the seventh may be None), its lowest code,
+its 12-bit pitch-class mask and its quality from QUALITIES (or None)"""
+
+# music21's weights of a third, fifth, seventh, ninth, eleventh and thirteenth above a candidate root
+CHORD_STEPS = [2, 4, 6, 1, 3, 5]
+CHORD_STEP_WEIGHTS = [1 / (i + 6) for i in range(len(CHORD_STEPS))]
+
+# pitch-class masks of chords built on pitch class 0
+QUALITIES = {
+    0b000010010001: "major",
+    0b000010001001: "minor",
+    0b000001001001: "diminished",
+    0b000100010001: "augmented",
+    0b010010010001: "dominant seventh",
+    0b100010010001: "major seventh",
+    0b010010001001: "minor seventh",
+    0b010001001001: "half-diminished seventh",
+    0b001001001001: "diminished seventh",
+}
+
+
+def letter(code):
+    """Returns the letter of a code as a number from 0 for C to 6 for B
+    """
+    return (code[1] - 1) % 7
+
+
+def letter_mask(codes):
+    mask = 0
+    for code in codes:
+        mask |= 1 << letter(code)
+    return mask
+
+
+def pitch_class_mask(codes):
+    mask = 0
+    for code in codes:
+        mask |= 1 << code[0] % 12
+    return mask
+
+
+def find_roots(mask):
+    """Returns the mask of the letter music21 picks as root of a set of letters.
+    Every letter is returned for a chord with all seven, whose root music21 takes
+    from its bass, which four voices cannot reach.
+
+    >>> bin(find_roots(0b0010101))  # C E G
+    '0b1'
+    >>> bin(find_roots(0b1010001))  # C G B
+    '0b1'
+    >>> bin(find_roots(0b0101000))  # F A
+    '0b1000'
+    """
+    letters = [i for i in range(7) if mask >> i & 1]
+    if len(letters) <= 1 or len(letters) == 7:
+        return mask
+
+    # a letter with every other letter stacked in thirds above it, tried from C up
+    for start in range(len(letters)):
+        rotated = letters[start:] + letters[:start]
+        if all((b - a) % 7 == 2 for a, b in zip(rotated, rotated[1:])):
+            return 1 << letters[start]
+
+    scores = {i: sum(weight for step, weight in zip(CHORD_STEPS, CHORD_STEP_WEIGHTS)
+                     if mask >> ((i + step) % 7) & 1)
+              for i in letters}
+    best = max(scores.values())
+    return sum(1 << i for i in letters if scores[i] == best)
+
+
+ROOTS = [find_roots(mask) for mask in range(128)]
+ROOT_ARRAY = np.array(ROOTS, dtype=np.uint8)
+
+
+def root(codes):
+    """Returns the code music21 gives as root of the chord of a slice of codes.
+
+    >>> root([(43, 19), (53, 25), (59, 28), (62, 30)])
+    (43, 19)
+    """
+    roots = ROOTS[letter_mask(codes)]
+    for code in codes:
+        if roots >> letter(code) & 1:
+            return code
+
+
+def seventh(codes):
+    """Returns the code music21 gives as seventh of the chord of a slice of codes, or None.
+
+    >>> seventh([(43, 19), (53, 25), (59, 28), (62, 30)])
+    (53, 25)
+    >>> seventh([(48, 22), (55, 26), (64, 31), (72, 36)])
+    """
+    target = (letter(root(codes)) + 6) % 7
+    for code in codes:
+        if letter(code) == target:
+            return code
+
+
+def analyze(codes):
+    """Returns the Sonority of a slice of codes ordered from the bass up.
+
+    >>> analyze([(43, 19), (53, 25), (59, 28), (62, 30)]).quality
+    'dominant seventh'
+    """
+    chord_root = root(codes)
+    mask = pitch_class_mask(codes)
+    relative = ((mask >> chord_root[0] % 12) | (mask << (12 - chord_root[0] % 12))) & 0xfff
+    return Sonority(chord_root, seventh(codes), min(codes), mask, QUALITIES.get(relative))
+
+
+def find_sevenths(steps):
+    """Returns, for a (number of voices, length) array of diatonic steps ordered from the bass up,
+    the index of the voice holding the seventh of each slice, or -1 where it has none
+    """
+    letters = (np.asarray(steps, dtype=np.int64) - 1) % 7
+    bits = np.left_shift(1, letters)
+    masks = np.bitwise_or.reduce(bits, axis=0)
+    # the root is the first voice whose letter is the root letter of the mask
+    is_root = (ROOT_ARRAY[masks][np.newaxis, :] & bits) != 0
+    root_letters = letters[is_root.argmax(axis=0), np.arange(letters.shape[1])]
+    is_seventh = letters == (root_letters + 6) % 7
+    return np.where(is_seventh.any(axis=0), is_seventh.argmax(axis=0), -1)
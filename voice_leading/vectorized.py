@@ -0,0 +1,134 @@
+"""Vectorized parallel and direct motion checks.
+
+The voices are encoded once as integer arrays of MIDI numbers and diatonic
+steps. Every pairwise interval of the chorale is then computed in a single
+NumPy pass instead of building a music21 Interval per pair of notes.
+"""
+from itertools import combinations
+
+import numpy as np
+
+from . import pitches
+
+MOTION_RULES = ["parallel_fifths", "parallel_octaves", "parallel_fourths",
+                "direct_fifths", "direct_octaves"]
+
+
+def encode_voices(voices):
+    """Returns (midi, steps) integer arrays of shape (number of voices, length)
+    """
+    assert len(set(len(voice) for voice in voices)) <= 1, "Voices must have same length"
+    encoded = [pitches.encode_voice(voice) for voice in voices]
+    midi = np.array([m for m, _ in encoded], dtype=np.int16).reshape(len(voices), -1)
+    steps = np.array([s for _, s in encoded], dtype=np.int16).reshape(len(voices), -1)
+    return midi, steps
+
+
+def interval_tensor(values):
+    """Returns an array whose element [a, b, i] is values[b, i] - values[a, i]
+    """
+    return values[np.newaxis, :, :] - values[:, np.newaxis, :]
+
+
+def simple_semitones(midi_difference, step_difference, octaves):
+    """Returns the size in semitones of an interval reduced by the given number of octaves,
+    measured in the direction of its generic interval
+    """
+    direction = np.where(step_difference < 0, -1, 1)
+    return direction * midi_difference - 12 * octaves
+
+
+def perfect_fifths(midi_difference, step_difference):
+    """Returns a mask of the intervals whose simple name is P5
+    """
+    generic = np.abs(step_difference)
+    return ((generic % 7 == 4) &
+            (simple_semitones(midi_difference, step_difference, generic // 7) == 7))
+
+
+def perfect_octaves(midi_difference, step_difference):
+    """Returns a mask of the intervals whose semi-simple name is P8
+    """
+    generic = np.abs(step_difference)
+    return ((generic > 0) & (generic % 7 == 0) &
+            (simple_semitones(midi_difference, step_difference, generic // 7 - 1) == 12))
+
+
+def fourths(step_difference):
+    """Returns a mask of the intervals that reduce to a fourth of any quality
+    """
+    return np.abs(step_difference) % 7 == 3
+
+
+def generic_motion(steps):
+    """Returns the directed generic interval each voice moves by into each index.
+    Index 0 has no motion and is 0.
+    """
+    motion = np.zeros_like(steps)
+    difference = np.diff(steps, axis=1)
+    motion[:, 1:] = np.where(difference >= 0, difference + 1, difference - 1)
+    return motion
+
+
+def find_motion(voices):
+    """Returns a dict mapping every rule in MOTION_RULES to a boolean array of shape
+    (number of voices, number of voices, length). Element [a, b, i] is True
+    if voice a as the lower voice and voice b as the upper voice break the rule at index i.
+
+    >>> from music21 import note, stream
+    >>> soprano = stream.Part([note.Note(n) for n in ['F5', 'G5', 'A5']])
+    >>> alto = stream.Part([note.Note(n) for n in ['G4', 'G4', 'G4']])
+    >>> bass = stream.Part([note.Note(n) for n in ['C3', 'C3', 'D3']])
+    >>> motion = find_motion([bass, alto, soprano])
+    >>> first_violation(motion, "parallel_fifths", 0, 2)
+    2
+    >>> first_violation(motion, "parallel_fifths", 1, 2) is None
+    True
+    """
+    midi, steps = encode_voices(voices)
+    midi_difference, step_difference = interval_tensor(midi), interval_tensor(steps)
+    fifths = perfect_fifths(midi_difference, step_difference)
+    octaves = perfect_octaves(midi_difference, step_difference)
+    is_fourth = fourths(step_difference)
+
+    # the lower voice of the pair must move for the motion to be parallel
+    lower_moves = np.zeros(midi.shape, dtype=bool)
+    lower_moves[:, 1:] = (midi[:, 1:] != midi[:, :-1]) | (steps[:, 1:] != steps[:, :-1])
+    lower_moves = lower_moves[:, np.newaxis, :]
+
+    def parallel(mask):
+        result = np.zeros_like(mask)
+        result[:, :, 1:] = mask[:, :, 1:] & mask[:, :, :-1]
+        return result & lower_moves
+
+    motion = generic_motion(steps)
+    lower_motion = motion[:, np.newaxis, :]
+    upper_motion = motion[np.newaxis, :, :]
+    similar = (lower_motion * upper_motion > 0) & (np.abs(upper_motion) > 2)
+    similar[:, :, 0] = False
+
+    return {
+        "parallel_fifths": parallel(fifths),
+        "parallel_octaves": parallel(octaves),
+        "parallel_fourths": parallel(is_fourth),
+        "direct_fifths": fifths & similar,
+        "direct_octaves": octaves & similar,
+    }
+
+
+def first_violation(motion, rule, lower, upper):
+    """Returns the first index where the voices at positions lower and upper break
+    the given rule, or None
+    """
+    indices = np.flatnonzero(motion[rule][lower, upper])
+    if len(indices):
+        return int(indices[0])
+
+
+def violations(motion, rule):
+    """Yields (lower, upper, index) for every violation of the given rule
+    """
+    number_of_voices = motion[rule].shape[0]
+    for lower, upper in combinations(range(number_of_voices), 2):
+        for index in np.flatnonzero(motion[rule][lower, upper]):
+            yield lower, upper, int(index)